@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 
 from cafe.forms import OrderForm
-from cafe.models import Shop, Cafe, Address, Table, Menu, Product, Ingredient, UnitType, Order, OrderStatus, \
-    PaymentType, StorageState, Supply, SuppliedIngredient
+from cafe.models import Shop, Cafe, Address, Table, Menu, Product, Ingredient, UnitType, Order, OrderProduct, \
+    OrderStatus, PaymentType, StorageState, Supply, SuppliedIngredient
+from cafe.services import update_daily_sales
 from users.admin import TableInline
 
 
@@ -23,6 +25,12 @@ class SuppliedIngredientInline(admin.TabularInline):
     autocomplete_fields = ('ingredient',)
 
 
+class OrderProductInline(admin.TabularInline):
+    model = OrderProduct
+    extra = 1
+    autocomplete_fields = ('product',)
+
+
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
     list_display = ('name', 'start_time', 'close_time', 'address')
@@ -83,7 +91,28 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('employee', 'client', 'amount', 'timestamp')
     search_fields = ('employee', 'client',)
     ordering = ('-timestamp',)
-    autocomplete_fields = ('order_status', 'payment_type', 'products')
+    autocomplete_fields = ('order_status', 'payment_type')
+    inlines = (OrderProductInline,)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            update_daily_sales(Order.objects.get(pk=obj.pk), -1)
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_daily_sales(form.instance, 1)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            update_daily_sales(obj, -1)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for order in queryset.prefetch_related('orderproduct_set'):
+                update_daily_sales(order, -1, {line.product_id: line.quantity for line in order.orderproduct_set.all()})
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(OrderStatus)
@@ -1,12 +1,29 @@
+from datetime import timedelta
+
 import django_filters
+from django.utils.timezone import localtime
 
 from cafe.models import Order, Shop
 from users.models import Schedule, User
 
 
+def _midnight(days_ago=0):
+    return localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days_ago)
+
+
+class TimestampRangeFilter(django_filters.DateRangeFilter):
+    filters = {
+        'today': lambda qs, name: qs.filter(**{'%s__gte' % name: _midnight()}),
+        'yesterday': lambda qs, name: qs.filter(**{'%s__gte' % name: _midnight(1), '%s__lt' % name: _midnight()}),
+        'week': lambda qs, name: qs.filter(**{'%s__gte' % name: _midnight(7)}),
+        'month': lambda qs, name: qs.filter(**{'%s__gte' % name: _midnight().replace(day=1)}),
+        'year': lambda qs, name: qs.filter(**{'%s__gte' % name: _midnight().replace(month=1, day=1)}),
+    }
+
+
 class OrdersFilter(django_filters.FilterSet):
     shop = django_filters.ModelChoiceFilter(queryset=Shop.objects.all(), label='Coffeehouse')
-    date_range = django_filters.DateRangeFilter(label='Date range', field_name='timestamp')
+    date_range = TimestampRangeFilter(label='Date range', field_name='timestamp')
 
     class Meta:
         model = Order
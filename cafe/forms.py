@@ -1,11 +1,11 @@
-from datetime import datetime
-
 from bootstrap_datepicker_plus import DatePickerInput
 from django import forms
 from django.contrib.auth import get_user_model
 from django.forms import formset_factory, inlineformset_factory
 
-from cafe.models import Order, Shop, StorageState, Menu, Supply, SuppliedIngredient
+from cafe.models import Order, Shop, Supply, SuppliedIngredient, Ingredient
+from cafe.services import get_ingredient_requirements, get_missing_ingredients, get_current_menu, \
+    MISSING_INGREDIENTS_MESSAGE
 
 User = get_user_model()
 
@@ -21,27 +21,47 @@ class OrderForm(forms.ModelForm):
 
 class CreateOrderForm(forms.ModelForm):
     shop = forms.ModelChoiceField(queryset=Shop.objects.all(), label='Coffeehouse', required=True)
-    products = forms.ModelMultipleChoiceField(
-        queryset=Menu.objects.filter(start_date__lte=datetime.today(), end_date__gte=datetime.today()).last().products
-    )
 
     class Meta:
         model = Order
-        exclude = ('client', 'employee', 'order_status', 'amount')
+        exclude = ('client', 'employee', 'order_status', 'amount', 'products')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        menu = get_current_menu()
+        self.products = list(menu.products.all()) if menu else []
+        for product in self.products:
+            self.fields[self.get_quantity_field_name(product)] = forms.IntegerField(
+                label='{} ({} PLN)'.format(product.name, product.price), min_value=0, initial=0, required=False
+            )
+
+    @staticmethod
+    def get_quantity_field_name(product):
+        return 'quantity_{}'.format(product.pk)
 
     def clean(self):
-        products = self.cleaned_data.get('products')
-        for product in products:
-            for ingredient in product.ingredients.all():
-                storage = StorageState.objects.filter(shop=self.cleaned_data.get('shop'), ingredient=ingredient).last()
-                if storage:
-                    storage.amount = storage.amount - product.productingredient_set.get(ingredient=ingredient).amount
-                    if storage.amount > 0:
-                        return super().clean()
-                raise forms.ValidationError('Not enough ingredients to prepare these products ({})'.format(ingredient.name))
+        cleaned_data = super().clean()
+        self.lines = [
+            (product, cleaned_data[self.get_quantity_field_name(product)]) for product in self.products
+            if cleaned_data.get(self.get_quantity_field_name(product))
+        ]
+        if not self.lines:
+            raise forms.ValidationError('Choose at least one product')
+        shop = cleaned_data.get('shop')
+        if shop is None:
+            return cleaned_data
+
+        self.requirements = get_ingredient_requirements({product.pk: quantity for product, quantity in self.lines})
+        missing = get_missing_ingredients(shop, self.requirements)
+        if missing:
+            raise forms.ValidationError(MISSING_INGREDIENTS_MESSAGE.format(
+                ', '.join(ingredient.name for ingredient in missing)
+            ))
+        return cleaned_data
 
 
 class SupplyIngredientForm(forms.ModelForm):
+    ingredient = forms.ModelChoiceField(queryset=Ingredient.objects.select_related('unit_type'))
     amount = forms.IntegerField(required=True)
 
     class Meta:
@@ -66,3 +86,11 @@ class FilterForm(forms.Form):
     shop = forms.ModelChoiceField(queryset=Shop.objects.all(), label='Coffeehouse', required=False)
     start_date = forms.DateField(widget=DatePickerInput(format='%m/%d/%Y'), label="From", required=False)
     end_date = forms.DateField(widget=DatePickerInput(format='%m/%d/%Y'), label="To", required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise forms.ValidationError('Start date can\'t be later than end date')
+        return cleaned_data
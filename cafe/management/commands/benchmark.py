@@ -0,0 +1,107 @@
+import math
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, close_old_connections
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from cafe.models import Shop
+from users.models import User, Employee
+
+ENDPOINTS = (
+    ('cafe:shops', None, None),
+    ('cafe:cafe', None, None),
+    ('cafe:menu', None, None),
+    ('cafe:orders', 'employee', None),
+    ('cafe:online-orders', 'employee', None),
+    ('cafe:online-orders', 'client', None),
+    ('cafe:storage', 'employee', None),
+    ('users:bookings', 'client', None),
+    ('users:availability', None, None),
+    ('users:schedules', 'admin', None),
+    ('users:salaries', 'admin', None),
+    ('users:supplies', 'admin', None),
+    ('users:order-report', 'admin', None),
+    ('users:employee-order-report', 'admin', None),
+    ('users:ingredient-report', 'admin', None),
+    ('users:ingredient-report', 'admin', 'export'),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Requests the main views through the test client and reports p50/p95 latency and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per endpoint')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--only', nargs='*', default=(), help='URL names to benchmark')
+
+    def handle(self, *args, **options):
+        users = {
+            'admin': User.objects.filter(employee__job_title=Employee.ADMIN).first(),
+            'employee': User.objects.filter(employee__isnull=False).exclude(employee__job_title=Employee.ADMIN).first(),
+            'client': User.objects.filter(client__isnull=False).first(),
+        }
+        shop = Shop.objects.first()
+        if shop is None or not all(users.values()):
+            raise CommandError('Not enough data to benchmark, run generate_data first')
+
+        setup_test_environment()
+        try:
+            self.stdout.write('{} database (CONN_MAX_AGE={}), {} measured requests per endpoint{}'.format(
+                connection.vendor, connection.settings_dict['CONN_MAX_AGE'], options['requests'],
+                ', cold cache' if options['cold'] else ''
+            ))
+            self.stdout.write('{:<40} {:>6} {:>10} {:>10} {:>8}'.format('endpoint', 'status', 'p50 ms', 'p95 ms', 'queries'))
+            for name, role, variant in ENDPOINTS:
+                if options['only'] and name not in options['only']:
+                    continue
+                client = TestClient()
+                if role:
+                    client.force_login(users[role])
+                url, data = self.get_request(name, variant, shop)
+                status, timings, queries = self.measure(client, url, data, options)
+                details = ', '.join(detail for detail in (role, variant) if detail)
+                label = '{} ({})'.format(name, details) if details else name
+                self.stdout.write('{:<40} {:>6} {:>10.1f} {:>10.1f} {:>8}'.format(
+                    label, status, percentile(timings, 50), percentile(timings, 95), max(queries)
+                ))
+        finally:
+            teardown_test_environment()
+
+    def get_request(self, name, variant, shop):
+        if name == 'users:availability':
+            return reverse(name, kwargs={'pk': shop.pk}), {'date': (timezone.localdate() + timedelta(days=1)).isoformat()}
+        if variant == 'export':
+            return reverse(name), {'export': 'csv'}
+        return reverse(name), {}
+
+    def measure(self, client, url, data, options):
+        timings, queries, status = [], [], None
+        for i in range(options['warmup'] + options['requests']):
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                close_old_connections()
+                response = client.get(url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                close_old_connections()
+                duration = (time.perf_counter() - start) * 1000
+            status = response.status_code
+            if i >= options['warmup']:
+                timings.append(duration)
+                queries.append(len(context))
+        return status, timings, queries
@@ -0,0 +1,211 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import int_to_base36
+
+from cafe.models import Cafe, Shop, Table, UnitType, Ingredient, Product, ProductIngredient, Menu, StorageState, \
+    OrderStatus, PaymentType, Order, OrderProduct
+from cafe.services import rebuild_daily_sales, bulk_create_in_chunks, BULK_CREATE_CHUNK_SIZE
+from users.models import User, Employee, Client, Booking, Schedule
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic dataset (shops, menus, orders, bookings, schedules) for local benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=5)
+        parser.add_argument('--tables', type=int, default=10, help='Tables per shop')
+        parser.add_argument('--ingredients', type=int, default=30)
+        parser.add_argument('--products', type=int, default=40)
+        parser.add_argument('--menus', type=int, default=4)
+        parser.add_argument('--employees', type=int, default=30)
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--bookings', type=int, default=2000)
+        parser.add_argument('--schedules', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365, help='Orders are spread over this many past days')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        for name in ('shops', 'products', 'employees'):
+            if options[name] < 1:
+                raise CommandError('--{} has to be at least 1'.format(name))
+        self.rng = random.Random(options['seed'])
+        # Generated names are unique, so every run gets its own prefix from the full current timestamp.
+        self.run = int(timezone.now().timestamp())
+        self.prefix = int_to_base36(self.run)
+        with transaction.atomic():
+            cafe = Cafe.objects.first() or Cafe.objects.create(
+                name='Elka Coffee', phone_number='000000000', email='elka@elka-coffee.pl'
+            )
+            shops = self.create_shops(cafe, options['shops'], options['tables'])
+            ingredients = self.create_ingredients(shops, options['ingredients'])
+            products = self.create_products(ingredients, options['products'])
+            self.create_menus(cafe, products, options['menus'])
+            employees, clients = self.create_users(cafe, options['employees'], options['clients'], options['password'])
+            orders = self.create_orders(shops, products, employees, clients, options['orders'], options['days'])
+            bookings = self.create_bookings(shops, clients, options['bookings'])
+            schedules = self.create_schedules(shops, employees, options['schedules'])
+        rows = rebuild_daily_sales()
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {} shops, {} products, {} orders, {} bookings and {} schedules ({} daily sales rows)'.format(
+                len(shops), len(products), orders, bookings, schedules, rows
+            )
+        ))
+
+    def create_shops(self, cafe, count, tables):
+        Shop.objects.bulk_create([Shop(
+            name='Shop {}-{}'.format(self.prefix, i), start_time=time(7), close_time=time(21), cafe=cafe,
+            phone_number='{:09d}{:04d}'.format(self.run % 10 ** 9, i), email='shop{}-{}@elka-coffee.pl'.format(self.prefix, i)
+        ) for i in range(count)])
+        shops = list(Shop.objects.filter(name__startswith='Shop {}-'.format(self.prefix)))
+        Table.objects.bulk_create([
+            Table(shop=shop, number=number + 1, max_seats=self.rng.choice((2, 2, 4, 4, 6)))
+            for shop in shops for number in range(tables)
+        ])
+        return shops
+
+    def create_ingredients(self, shops, count):
+        unit_type = UnitType.objects.first() or UnitType.objects.create(name='g')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Ingredient {}-{}'.format(self.prefix, i), unit_type=unit_type) for i in range(count)
+        ])
+        ingredients = list(Ingredient.objects.filter(name__startswith='Ingredient {}-'.format(self.prefix)))
+        StorageState.objects.bulk_create([
+            StorageState(shop=shop, ingredient=ingredient, amount=Decimal('999999'))
+            for shop in shops for ingredient in ingredients
+        ])
+        return ingredients
+
+    def create_products(self, ingredients, count):
+        Product.objects.bulk_create([Product(
+            name='Product {}-{}'.format(self.prefix, i), price=Decimal(self.rng.randint(500, 2500)) / 100
+        ) for i in range(count)])
+        products = list(Product.objects.filter(name__startswith='Product {}-'.format(self.prefix)))
+        ProductIngredient.objects.bulk_create([
+            ProductIngredient(product=product, ingredient=ingredient, amount=Decimal(self.rng.randint(1, 50)))
+            for product in products for ingredient in self.rng.sample(ingredients, min(len(ingredients), 4))
+        ])
+        return products
+
+    def create_menus(self, cafe, products, count):
+        today = timezone.localdate()
+        for i in range(count):
+            menu = Menu.objects.create(
+                name='Menu {}-{}'.format(self.prefix, i), cafe=cafe,
+                start_date=today - timedelta(days=90 * (i + 1)), end_date=today + timedelta(days=90 - 90 * i)
+            )
+            menu.products.set(self.rng.sample(products, max(len(products) * 3 // 4, 1)))
+
+    def create_users(self, cafe, employees, clients, password):
+        password = make_password(password)
+        User.objects.bulk_create([
+            User(username='employee-{}-{}'.format(self.prefix, i), password=password, first_name='Employee',
+                 last_name=str(i))
+            for i in range(employees)
+        ] + [
+            User(username='client-{}-{}'.format(self.prefix, i), password=password, first_name='Client',
+                 last_name=str(i))
+            for i in range(clients)
+        ])
+        employee_users = list(User.objects.filter(username__startswith='employee-{}-'.format(self.prefix)))
+        client_users = list(User.objects.filter(username__startswith='client-{}-'.format(self.prefix)))
+        Employee.objects.bulk_create([Employee(
+            user=user, cafe=cafe, job_title=Employee.ADMIN if i == 0 else self.rng.choice((Employee.BARIST, Employee.CASHIER))
+        ) for i, user in enumerate(employee_users)])
+        User.objects.filter(pk=employee_users[0].pk).update(is_superuser=True, is_staff=True)
+        Client.objects.bulk_create([
+            Client(user=user, email='{}@elka-coffee.pl'.format(user.username)) for user in client_users
+        ])
+        return employee_users, client_users
+
+    def create_orders(self, shops, products, employees, clients, count, days):
+        statuses = list(OrderStatus.objects.all()) or [
+            OrderStatus.objects.create(status='Pending'), OrderStatus.objects.create(status='Accepted')
+        ]
+        payment_types = list(PaymentType.objects.all()) or [PaymentType.objects.create(type='Cash')]
+        start = timezone.now() - timedelta(days=days)
+        # Orders are generated oldest first so their pks grow with the timestamp, like real ones.
+        hours = sorted(self.rng.randrange(max(days * 24, 1)) for _ in range(count))
+        for offset in range(0, count, BULK_CREATE_CHUNK_SIZE):
+            chunk = hours[offset:offset + BULK_CREATE_CHUNK_SIZE]
+            last_pk = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            orders, lines = [], []
+            for _ in chunk:
+                online = self.rng.random() < 0.3
+                order_products = [
+                    (product, self.rng.choice((1, 1, 1, 2, 3)))
+                    for product in self.rng.sample(products, self.rng.randint(1, min(len(products), 4)))
+                ]
+                orders.append(Order(
+                    amount=sum(product.price * quantity for product, quantity in order_products),
+                    shop=self.rng.choice(shops),
+                    client=self.rng.choice(clients) if online and clients else None,
+                    employee=self.rng.choice(employees)
+                    if employees and (not online or self.rng.random() < 0.8) else None,
+                    order_status=statuses[-1] if not online or self.rng.random() < 0.8 else statuses[0],
+                    payment_type=self.rng.choice(payment_types),
+                ))
+                lines.append(order_products)
+            Order.objects.bulk_create(orders)
+
+            order_ids = list(Order.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+            bulk_create_in_chunks(OrderProduct, (
+                OrderProduct(order_id=order_id, product=product, quantity=quantity, unit_price=product.price)
+                for order_id, order_products in zip(order_ids, lines) for product, quantity in order_products
+            ))
+            # auto_now_add stamped every order with the current time, the orders of an hour have consecutive pks
+            # and are moved back with a single update.
+            buckets = {}
+            for order_id, hour in zip(order_ids, chunk):
+                buckets.setdefault(hour, []).append(order_id)
+            for hour, bucket in buckets.items():
+                Order.objects.filter(pk__gte=bucket[0], pk__lte=bucket[-1]).update(
+                    timestamp=start + timedelta(hours=hour, seconds=self.rng.randrange(60 * 60))
+                )
+        return len(hours)
+
+    def create_bookings(self, shops, clients, count):
+        if not clients:
+            return 0
+        tables = {shop.pk: list(shop.table_set.all()) for shop in shops}
+        today = timezone.localdate()
+        last_pk = Booking.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        bookings, booking_tables = [], []
+        for i in range(count):
+            shop = self.rng.choice(shops)
+            start_time = timezone.make_aware(datetime.combine(
+                today + timedelta(days=self.rng.randint(-60, 60)), time(self.rng.randint(8, 18))
+            ))
+            bookings.append(Booking(
+                user=self.rng.choice(clients), start_time=start_time,
+                end_time=start_time + timedelta(hours=self.rng.randint(1, 3))
+            ))
+            booking_tables.append(self.rng.sample(tables[shop.pk], min(len(tables[shop.pk]), self.rng.randint(1, 2))))
+        bulk_create_in_chunks(Booking, bookings)
+        booking_ids = Booking.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)
+        bulk_create_in_chunks(Booking.tables.through, (
+            Booking.tables.through(booking_id=booking_id, table=table)
+            for booking_id, chosen in zip(booking_ids.iterator(), booking_tables) for table in chosen
+        ))
+        return len(bookings)
+
+    def create_schedules(self, shops, employees, count):
+        week_days = [day for day, _ in Schedule.DAYS_OF_WEEK]
+        today = timezone.localdate()
+        # Two shifts a day for every employee at most, more would only add conflicting schedules.
+        count = min(count, len(employees) * len(week_days) * 2)
+        bulk_create_in_chunks(Schedule, (Schedule(
+            user=employees[i % len(employees)], shop=self.rng.choice(shops),
+            week_day=week_days[i // len(employees) % len(week_days)],
+            start_time=time(7 + i // (len(employees) * len(week_days)) % 2 * 7),
+            end_time=time(14 + i // (len(employees) * len(week_days)) % 2 * 7),
+            approve_date=today if self.rng.random() < 0.7 else None
+        ) for i in range(count)))
+        return max(count, 0)
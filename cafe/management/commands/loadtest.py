@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cafe.management.commands.benchmark import percentile
+
+PATHS = ('/cafe/coffeehouses', '/cafe/about-us', '/cafe/menu')
+
+
+class Command(BaseCommand):
+    help = 'Sends concurrent HTTP requests to a running server and reports throughput and p50/p95 latency per path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--paths', nargs='*', default=PATHS)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per path')
+        parser.add_argument('--session', help='sessionid cookie to send, to load test pages behind a login')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Cookie': 'sessionid={}'.format(options['session'])} if options['session'] else {}
+        self.stdout.write('{} with {} concurrent clients, {} requests per path'.format(
+            options['url'], options['concurrency'], options['requests']
+        ))
+        self.stdout.write('{:<30} {:>8} {:>8} {:>10} {:>10}'.format('path', 'errors', 'req/s', 'p50 ms', 'p95 ms'))
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for path in options['paths']:
+                request = Request(options['url'].rstrip('/') + path, headers=headers)
+                self.fetch(request, options['timeout'])
+                start = time.perf_counter()
+                results = list(executor.map(
+                    lambda _: self.fetch(request, options['timeout']), range(options['requests'])
+                ))
+                duration = time.perf_counter() - start
+                timings = [timing for ok, timing in results if ok]
+                if not timings:
+                    raise CommandError('Every request to {} failed'.format(request.full_url))
+                self.stdout.write('{:<30} {:>8} {:>8.1f} {:>10.1f} {:>10.1f}'.format(
+                    path, len(results) - len(timings), len(results) / duration, percentile(timings, 50),
+                    percentile(timings, 95)
+                ))
+
+    def fetch(self, request, timeout):
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                response.read()
+        except OSError:
+            return False, None
+        return True, (time.perf_counter() - start) * 1000
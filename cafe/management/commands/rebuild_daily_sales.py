@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cafe.services import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollup used by the order reports from the full order history'
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_sales()
+        self.stdout.write(self.style.SUCCESS('Daily sales rebuilt ({} rows)'.format(rows)))
@@ -0,0 +1,67 @@
+# Generated by Django 2.2 on 2026-10-18 15:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_unit_prices(apps, schema_editor):
+    OrderProduct = apps.get_model('cafe', 'OrderProduct')
+    Product = apps.get_model('cafe', 'Product')
+    OrderProduct.objects.update(unit_price=models.Subquery(
+        Product.objects.filter(pk=models.OuterRef('product')).values('price')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafe', '0019_dailysales'),
+    ]
+
+    operations = [
+        # Order.products becomes a through model on top of the existing M2M table (order_id, product_id, unique
+        # together), only the migration state changes here.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderProduct',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafe.Order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cafe.Product')),
+                    ],
+                    options={
+                        'verbose_name': 'order product',
+                        'verbose_name_plural': 'order products',
+                        'db_table': 'cafe_order_products',
+                        'unique_together': {('order', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='cafe.OrderProduct', to='cafe.Product'),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='orderproduct',
+            table=None,
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.RunPython(set_unit_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5),
+        ),
+    ]
@@ -1,10 +1,57 @@
+import time
 from datetime import datetime
 
+from django.core.cache import cache
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+REPORTS_CACHE_VERSION_KEY = 'cafe:reports-version'
+DEFAULT_CAFE_CACHE_KEY = 'cafe:default-cafe'
+PUBLIC_PAGES_CACHE_VERSION_KEY = 'cafe:public-pages-version'
+
+
+def get_cache_version(key):
+    # Versions start from the current time in milliseconds instead of 1, so a version key that was culled or evicted
+    # is seeded again with a value that entries stored under the lost version never used.
+    version = int(time.time() * 1000)
+    if cache.add(key, version, None):
+        return version
+    return cache.get(key, version)
+
+
+def bump_cache_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def get_reports_cache_version():
+    return get_cache_version(REPORTS_CACHE_VERSION_KEY)
+
+
+def clear_reports_cache():
+    bump_cache_version(REPORTS_CACHE_VERSION_KEY)
+
+
+def get_public_pages_cache_version():
+    return get_cache_version(PUBLIC_PAGES_CACHE_VERSION_KEY)
+
+
+def clear_public_pages_cache():
+    bump_cache_version(PUBLIC_PAGES_CACHE_VERSION_KEY)
+
+
+def get_default_cafe_id():
+    cafe_id = cache.get(DEFAULT_CAFE_CACHE_KEY)
+    if cafe_id is None:
+        cafe_id = Cafe.objects.order_by('pk').values_list('pk', flat=True).first()
+        if cafe_id is not None:
+            cache.set(DEFAULT_CAFE_CACHE_KEY, cafe_id, None)
+    return cafe_id
+
 
 class Cafe(models.Model):
     name = models.CharField(max_length=30, unique=True)
@@ -91,6 +138,10 @@ class Menu(models.Model):
     def is_current(self):
         return self.start_date <= datetime.today() and self.end_date <= datetime.today()
 
+    @staticmethod
+    def get_current_cache_key():
+        return 'cafe:current-menu:{}'.format(datetime.today().date().isoformat())
+
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
@@ -153,7 +204,7 @@ class Order(models.Model):
     employee = models.ForeignKey(
         to='users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='accepted_by'
     )
-    products = models.ManyToManyField(to='Product', related_name='orders')
+    products = models.ManyToManyField(to='Product', through='OrderProduct', related_name='orders')
     shop = models.ForeignKey(to='Shop', on_delete=models.CASCADE, null=True, blank=True)
     order_status = models.ForeignKey(to='OrderStatus', on_delete=models.SET_NULL, null=True)
     payment_type = models.ForeignKey(to='PaymentType', on_delete=models.SET_NULL, null=True)
@@ -162,11 +213,55 @@ class Order(models.Model):
         verbose_name = _('order')
         verbose_name_plural = _('orders')
         ordering = ('-timestamp',)
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='order_timestamp_idx'),
+            models.Index(fields=['shop', '-timestamp', '-id'], name='order_shop_timestamp_idx'),
+            models.Index(fields=['order_status', '-timestamp', '-id'], name='order_status_timestamp_idx'),
+            models.Index(fields=['payment_type', '-timestamp', '-id'], name='order_payment_timestamp_idx'),
+            models.Index(fields=['employee', '-timestamp', '-id'], name='order_employee_timestamp_idx'),
+        ]
 
     def __str__(self):
         return '{} {} {} {}'.format(self.amount, self.client, self.payment_type, self.payment_type)
 
 
+class OrderProduct(models.Model):
+    order = models.ForeignKey(to='Order', on_delete=models.CASCADE)
+    product = models.ForeignKey(to='Product', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=5, decimal_places=2, blank=True)
+
+    class Meta:
+        unique_together = ('order', 'product')
+        verbose_name = _('order product')
+        verbose_name_plural = _('order products')
+
+    def __str__(self):
+        return '{} x {}'.format(self.quantity, self.product)
+
+
+class DailySales(models.Model):
+    date = models.DateField()
+    shop = models.ForeignKey(to='Shop', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_sales')
+    employee = models.ForeignKey(
+        to='users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales'
+    )
+    product = models.ForeignKey(
+        to='Product', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_sales'
+    )
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('daily sales')
+        verbose_name_plural = _('daily sales')
+        indexes = [
+            models.Index(fields=['date', 'shop'], name='daily_sales_date_shop_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} {} {}'.format(self.date, self.shop, self.product or '-', self.order_count)
+
+
 class OrderStatus(models.Model):
     status = models.CharField(max_length=20)
 
@@ -210,6 +305,63 @@ class SuppliedIngredient(models.Model):
     amount = models.PositiveIntegerField()
 
 
-@receiver(post_save, sender=Shop)
+@receiver(pre_save, sender=Shop)
 def set_cafe(sender, instance, **kwargs):
-    sender.objects.filter(id=instance.id).update(cafe=Cafe.objects.first())
+    if instance.cafe_id is None:
+        instance.cafe_id = get_default_cafe_id()
+
+
+@receiver(pre_save, sender=OrderProduct)
+def set_unit_price(sender, instance, **kwargs):
+    if instance.unit_price is None:
+        instance.unit_price = instance.product.price
+
+
+@receiver(post_save, sender=Cafe)
+@receiver(post_delete, sender=Cafe)
+def clear_default_cafe(sender, **kwargs):
+    cache.delete(DEFAULT_CAFE_CACHE_KEY)
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(m2m_changed, sender=Menu.products.through)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductIngredient)
+@receiver(post_delete, sender=ProductIngredient)
+def clear_current_menu(sender, **kwargs):
+    cache.delete(Menu.get_current_cache_key())
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_delete, sender=Supply)
+@receiver(post_save, sender=SuppliedIngredient)
+@receiver(post_delete, sender=SuppliedIngredient)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductIngredient)
+@receiver(post_delete, sender=ProductIngredient)
+@receiver(post_save, sender='users.Employee')
+@receiver(post_delete, sender='users.Employee')
+def clear_reports(sender, **kwargs):
+    clear_reports_cache()
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Cafe)
+@receiver(post_delete, sender=Cafe)
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(m2m_changed, sender=Menu.products.through)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductIngredient)
+@receiver(post_delete, sender=ProductIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def clear_public_pages(sender, **kwargs):
+    clear_public_pages_cache()
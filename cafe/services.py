@@ -0,0 +1,199 @@
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum, Q, Value, DecimalField, F, Case, When, Count, \
+    ExpressionWrapper, IntegerField
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localtime, localdate
+
+from cafe.models import Ingredient, ProductIngredient, StorageState, Menu, Product, Order, OrderProduct, DailySales, \
+    SuppliedIngredient, clear_reports_cache
+from users.models import User
+
+CURRENT_MENU_TIMEOUT = 60 * 60 * 24
+BULK_CREATE_CHUNK_SIZE = 1000
+MISSING_INGREDIENTS_MESSAGE = 'Not enough ingredients to prepare these products ({})'
+
+
+def get_current_menu():
+    key = Menu.get_current_cache_key()
+    menu = cache.get(key, False)
+    if menu is False:
+        today = datetime.today().date()
+        menu = Menu.objects.filter(start_date__lte=today, end_date__gte=today).prefetch_related(
+            'products__ingredients'
+        ).last()
+        cache.set(key, menu, CURRENT_MENU_TIMEOUT)
+    return menu
+
+
+def _daily_sales(start_date, end_date, shop=None):
+    # Filter the rollup itself, so the report reads only the requested days (daily_sales_date_shop_idx) instead of
+    # joining every row in history to the products, employees or ingredients.
+    sales = DailySales.objects.filter(date__gte=start_date, date__lt=end_date).order_by()
+    if shop:
+        sales = sales.filter(shop=shop)
+    return sales
+
+
+def get_product_order_report(start_date, end_date, shop=None):
+    totals = dict(_daily_sales(start_date, end_date, shop).filter(product__isnull=False).values('product').annotate(
+        total=Sum('order_count')
+    ).values_list('product', 'total'))
+    products = list(Product.objects.all())
+    for product in products:
+        product.order_count = totals.get(product.pk, 0)
+    return products
+
+
+def get_employee_order_report(start_date, end_date, shop=None):
+    totals = dict(_daily_sales(start_date, end_date, shop).filter(
+        product__isnull=True, employee__isnull=False
+    ).values('employee').annotate(total=Sum('order_count')).values_list('employee', 'total'))
+    # Reports are cached, keep password hashes and the rest of the account out of the pickled rows.
+    users = list(User.objects.filter(employee__isnull=False).select_related('employee').only(
+        'username', 'first_name', 'last_name', 'employee__job_title'
+    ))
+    for user in users:
+        user.order_count = totals.get(user.pk, 0)
+    return users
+
+
+def get_ingredient_usage(start_date, end_date, shop=None):
+    totals = dict(_daily_sales(start_date, end_date, shop).filter(
+        product__productingredient__isnull=False
+    ).values('product__productingredient__ingredient').annotate(total=Sum(ExpressionWrapper(
+        F('product__productingredient__amount') * F('order_count'),
+        output_field=DecimalField(max_digits=8, decimal_places=2)
+    ))).values_list('product__productingredient__ingredient', 'total'))
+    ingredients = list(Ingredient.objects.select_related('unit_type'))
+    for ingredient in ingredients:
+        ingredient.ingredient_sum = totals.get(ingredient.pk, Decimal(0))
+    return ingredients
+
+
+def get_order_quantities(order):
+    return dict(order.orderproduct_set.values_list('product', 'quantity'))
+
+
+def update_daily_sales(order, delta, quantities=None):
+    if quantities is None:
+        quantities = get_order_quantities(order)
+    keys = {'date': localtime(order.timestamp).date(), 'shop_id': order.shop_id, 'employee_id': order.employee_id}
+    counts = {None: delta}
+    counts.update((product_id, delta * quantity) for product_id, quantity in quantities.items())
+
+    with transaction.atomic():
+        existing = dict(DailySales.objects.filter(
+            Q(product__isnull=True) | Q(product__in=quantities), **keys
+        ).values_list('product', 'pk'))
+        DailySales.objects.filter(pk__in=existing.values()).update(order_count=F('order_count') + Case(
+            *[When(product=product_id, then=Value(count)) for product_id, count in counts.items() if product_id],
+            default=Value(delta), output_field=IntegerField()
+        ))
+        DailySales.objects.bulk_create([
+            DailySales(product_id=product_id, order_count=count, **keys)
+            for product_id, count in counts.items() if product_id not in existing
+        ])
+    # Reports covering today are only cached for a short while, so just orders from earlier days that change or get
+    # cancelled have to evict the cached historical ranges.
+    if keys['date'] < localdate():
+        transaction.on_commit(clear_reports_cache)
+
+
+def bulk_create_in_chunks(model, objs, chunk_size=BULK_CREATE_CHUNK_SIZE):
+    objs = iter(objs)
+    chunk = list(islice(objs, chunk_size))
+    while chunk:
+        model.objects.bulk_create(chunk)
+        chunk = list(islice(objs, chunk_size))
+
+
+def rebuild_daily_sales():
+    orders = Order.objects.annotate(date=TruncDate('timestamp')).order_by().values(
+        'date', 'shop', 'employee'
+    ).annotate(order_count=Count('id'))
+    order_lines = OrderProduct.objects.annotate(date=TruncDate('order__timestamp')).order_by().values(
+        'date', 'order__shop', 'order__employee', 'product'
+    ).annotate(order_count=Sum('quantity'))
+
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        bulk_create_in_chunks(DailySales, (DailySales(
+            date=row['date'], shop_id=row['shop'], employee_id=row['employee'], order_count=row['order_count']
+        ) for row in orders.iterator()))
+        bulk_create_in_chunks(DailySales, (DailySales(
+            date=row['date'], shop_id=row['order__shop'], employee_id=row['order__employee'],
+            product_id=row['product'], order_count=row['order_count']
+        ) for row in order_lines.iterator()))
+    transaction.on_commit(clear_reports_cache)
+    return DailySales.objects.count()
+
+
+def get_ingredient_requirements(quantities):
+    requirements = {}
+    for product_id, ingredient_id, amount in ProductIngredient.objects.filter(product__in=quantities).values_list(
+        'product', 'ingredient', 'amount'
+    ):
+        requirements[ingredient_id] = requirements.get(ingredient_id, 0) + amount * quantities[product_id]
+    return requirements
+
+
+def get_missing_ingredients(shop, requirements, lock=False):
+    storage = StorageState.objects.filter(shop=shop, ingredient__in=requirements)
+    if lock:
+        # Hold the storage rows until the transaction ends so concurrent orders can't both spend the same stock,
+        # always locking in pk order keeps two orders from deadlocking on each other's rows.
+        storage = storage.select_for_update().order_by('pk')
+    in_storage = dict(storage.values_list('ingredient', 'amount'))
+    missing = [
+        ingredient for ingredient, amount in requirements.items()
+        if in_storage.get(ingredient) is None or in_storage[ingredient] < amount
+    ]
+    if not missing:
+        return []
+    return list(Ingredient.objects.filter(id__in=missing).order_by('name'))
+
+
+def _storage_amounts(requirements):
+    return Case(
+        *[When(ingredient=ingredient, then=Value(amount)) for ingredient, amount in requirements.items()],
+        output_field=DecimalField(max_digits=8, decimal_places=2)
+    )
+
+
+def deduct_ingredients(shop, requirements):
+    if not requirements:
+        return
+
+    with transaction.atomic():
+        missing = get_missing_ingredients(shop, requirements, lock=True)
+        if missing:
+            raise ValidationError(MISSING_INGREDIENTS_MESSAGE.format(', '.join(ingredient.name for ingredient in missing)))
+        StorageState.objects.filter(shop=shop, ingredient__in=requirements).update(
+            amount=F('amount') - _storage_amounts(requirements)
+        )
+
+
+def receive_supply(supply, lines):
+    amounts = {}
+    for ingredient, amount in lines:
+        amounts[ingredient.pk] = amounts.get(ingredient.pk, 0) + amount
+    if not amounts:
+        return
+
+    with transaction.atomic():
+        SuppliedIngredient.objects.bulk_create([
+            SuppliedIngredient(supply=supply, ingredient=ingredient, amount=amount) for ingredient, amount in lines
+        ])
+        StorageState.objects.bulk_create([
+            StorageState(shop_id=supply.shop_id, ingredient_id=ingredient, amount=0) for ingredient in amounts
+        ], ignore_conflicts=True)
+        StorageState.objects.filter(shop_id=supply.shop_id, ingredient__in=amounts).update(
+            amount=F('amount') + _storage_amounts(amounts)
+        )
+    transaction.on_commit(clear_reports_cache)
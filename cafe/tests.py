@@ -1,3 +1,405 @@
-from django.test import TestCase
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cafe.models import Cafe, UnitType, Ingredient, Product, ProductIngredient, Menu, Shop, StorageState, Table, \
+    OrderStatus, PaymentType, Order, OrderProduct, Supply, SuppliedIngredient, DailySales, clear_reports_cache, \
+    get_reports_cache_version, REPORTS_CACHE_VERSION_KEY
+from cafe.services import rebuild_daily_sales, get_current_menu, update_daily_sales, get_product_order_report, \
+    get_employee_order_report, get_ingredient_usage, get_order_quantities
+from users.models import User, Employee, Client, Booking, Schedule, Salary
+
+
+class CafeFixturesMixin:
+    orders_count = 300
+    bookings_count = 200
+    schedules_count = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        cls.cafe = Cafe.objects.create(name='Elka', phone_number='100', email='elka@elka.pl')
+        unit_type = UnitType.objects.create(name='g')
+        cls.ingredients = [Ingredient.objects.create(name='ingredient {}'.format(i), unit_type=unit_type) for i in range(8)]
+        cls.products = []
+        for i in range(10):
+            product = Product.objects.create(name='product {}'.format(i), price=Decimal('5.50') + i)
+            ProductIngredient.objects.bulk_create([
+                ProductIngredient(product=product, ingredient=ingredient, amount=Decimal('1.50'))
+                for ingredient in rng.sample(cls.ingredients, 3)
+            ])
+            cls.products.append(product)
+        today = date.today()
+        for i in range(3):
+            menu = Menu.objects.create(
+                name='menu {}'.format(i), start_date=today - timedelta(days=30 * (i + 1)),
+                end_date=today + timedelta(days=30) - timedelta(days=30 * i), cafe=cls.cafe
+            )
+            menu.products.set(cls.products[i:i + 8])
+
+        cls.shops = [Shop.objects.create(
+            name='shop {}'.format(i), start_time=time(8), close_time=time(20), phone_number=str(200 + i),
+            email='shop{}@elka.pl'.format(i)
+        ) for i in range(3)]
+        for shop in cls.shops:
+            StorageState.objects.bulk_create([
+                StorageState(shop=shop, ingredient=ingredient, amount=Decimal('100000')) for ingredient in cls.ingredients
+            ])
+            Table.objects.bulk_create([Table(shop=shop, number=n, max_seats=2 + n % 4) for n in range(8)])
+        cls.tables = list(Table.objects.all())
+
+        OrderStatus.objects.create(status='pending')
+        OrderStatus.objects.create(status='accepted')
+        cls.payment_type = PaymentType.objects.create(type='cash')
+
+        cls.admin = User.objects.create(username='admin')
+        Employee.objects.create(user=cls.admin, job_title=Employee.ADMIN, cafe=cls.cafe)
+        cls.barist = User.objects.create(username='barist')
+        Employee.objects.create(user=cls.barist, job_title=Employee.BARIST, cafe=cls.cafe)
+        cls.client_user = User.objects.create(username='client')
+        Client.objects.create(user=cls.client_user, email='client@elka.pl')
+        cls.employees = [cls.admin, cls.barist]
+        for i in range(10):
+            user = User.objects.create(username='employee {}'.format(i))
+            Employee.objects.create(user=user, job_title=Employee.CASHIER, cafe=cls.cafe)
+            cls.employees.append(user)
+
+        cls.create_orders(cls.orders_count, rng)
+
+        now = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        bookings = Booking.objects.bulk_create([Booking(
+            user=cls.client_user, start_time=now + timedelta(days=i % 30, hours=i % 8),
+            end_time=now + timedelta(days=i % 30, hours=i % 8 + 1)
+        ) for i in range(cls.bookings_count)])
+        bookings = list(Booking.objects.order_by('pk')[:len(bookings)])
+        Booking.tables.through.objects.bulk_create([
+            Booking.tables.through(booking=booking, table=rng.choice(cls.tables)) for booking in bookings
+        ])
+
+        week_days = [day for day, _ in Schedule.DAYS_OF_WEEK]
+        Schedule.objects.bulk_create([Schedule(
+            user=cls.employees[i % len(cls.employees)], shop=cls.shops[i % len(cls.shops)],
+            week_day=week_days[i // len(cls.employees) % len(week_days)], start_time=time(8 + i % 3 * 4),
+            end_time=time(12 + i % 3 * 4), approve_date=today if i % 2 else None
+        ) for i in range(cls.schedules_count)])
+
+        Salary.objects.bulk_create([
+            Salary(user=user, amount=Decimal('3000'), date=today - timedelta(days=30 * month))
+            for month in range(6) for user in cls.employees
+        ])
+
+        supply = Supply.objects.create(date=today, shop=cls.shops[0])
+        SuppliedIngredient.objects.bulk_create([
+            SuppliedIngredient(supply=supply, ingredient=ingredient, amount=10) for ingredient in cls.ingredients
+        ])
+
+    @classmethod
+    def create_orders(cls, count, rng):
+        last_pk = Order.objects.order_by('pk').values_list('pk', flat=True).last() or 0
+        Order.objects.bulk_create([Order(
+            amount=Decimal('10'), shop=rng.choice(cls.shops), employee=rng.choice(cls.employees),
+            client=cls.client_user if i % 3 == 0 else None, order_status_id=2, payment_type=cls.payment_type
+        ) for i in range(count)])
+        orders = list(Order.objects.filter(pk__gt=last_pk).order_by('pk'))
+        for days in range(30):
+            Order.objects.filter(pk__in=[order.pk for order in orders[days::30]]).update(
+                timestamp=timezone.now() - timedelta(days=days)
+            )
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product=product, quantity=rng.randint(1, 3), unit_price=product.price)
+            for order in orders for product in rng.sample(cls.products, rng.randint(1, 3))
+        ])
+        rebuild_daily_sales()
+
+    def setUp(self):
+        cache.clear()
+
+    @contextmanager
+    def assertMaxQueries(self, number):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        self.assertLessEqual(
+            len(context), number, '{} queries executed, {} expected at most:\n{}'.format(
+                len(context), number, '\n'.join(query['sql'] for query in context.captured_queries)
+            )
+        )
+
+    def assertPageQueries(self, user, url, number, status_code=200, data=None, method='get'):
+        if user:
+            self.client.force_login(user)
+        with self.assertMaxQueries(number):
+            response = getattr(self.client, method)(url, data or {})
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CafeViewsQueriesTest(CafeFixturesMixin, TestCase):
+    def test_public_pages(self):
+        self.assertPageQueries(None, reverse('cafe:shops'), 1)
+        self.assertPageQueries(None, reverse('cafe:cafe'), 1)
+        self.assertPageQueries(None, reverse('cafe:menu'), 3)
+        for name in ('cafe:shops', 'cafe:cafe', 'cafe:menu'):
+            self.assertPageQueries(None, reverse(name), 0)
+
+    def test_public_pages_invalidation(self):
+        self.client.get(reverse('cafe:shops'))
+        self.client.get(reverse('cafe:menu'))
+        Shop.objects.filter(pk=self.shops[0].pk).get().save()
+        response = self.assertPageQueries(None, reverse('cafe:shops'), 1)
+        self.assertContains(response, self.shops[0].name)
+        self.products[1].name = 'flat white'
+        self.products[1].save()
+        response = self.assertPageQueries(None, reverse('cafe:menu'), 3)
+        self.assertContains(response, 'flat white')
+
+    def test_public_page_fragments(self):
+        self.assertPageQueries(self.client_user, reverse('cafe:menu'), 5)
+        self.client.get(reverse('cafe:shops'))
+        self.client.get(reverse('cafe:menu'))
+        self.assertPageQueries(self.barist, reverse('cafe:shops'), 2)
+        self.assertPageQueries(self.barist, reverse('cafe:menu'), 2)
+
+    def test_order_lists(self):
+        response = self.assertPageQueries(self.barist, reverse('cafe:orders'), 14)
+        self.assertPageQueries(self.barist, '{}?{}'.format(reverse('cafe:orders'), response.context['next_page_query']), 11)
+        self.assertPageQueries(self.barist, reverse('cafe:orders'), 12, data={'shop': self.shops[0].pk, 'date_range': 'month'})
+        self.assertPageQueries(self.barist, reverse('cafe:online-orders'), 7)
+        self.assertPageQueries(self.client_user, reverse('cafe:online-orders'), 7)
+
+    def test_order_lists_filter(self):
+        month_start = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        orders = Order.objects.filter(client__isnull=True).order_by('pk')
+        Order.objects.filter(pk__in=[order.pk for order in orders[:20]]).update(timestamp=month_start - timedelta(days=1))
+        expected = list(orders.filter(shop=self.shops[0], timestamp__gte=month_start).order_by('-timestamp', '-pk')[:20])
+        self.assertTrue(expected)
+        response = self.assertPageQueries(
+            self.barist, reverse('cafe:orders'), 14, data={'shop': self.shops[0].pk, 'date_range': 'month'}
+        )
+        self.assertEqual(list(response.context['order_list']), expected)
+
+    def test_order_lists_pages_with_equal_timestamps(self):
+        orders = Order.objects.filter(client__isnull=True)
+        # 50 orders share one timestamp, so page boundaries fall between them.
+        Order.objects.filter(pk__in=list(orders.order_by('pk').values_list('pk', flat=True)[:50])).update(
+            timestamp=timezone.now() - timedelta(days=1)
+        )
+        expected = list(orders.order_by('-timestamp', '-pk').values_list('pk', flat=True))
+        self.client.force_login(self.barist)
+        seen, query = [], ''
+        while query is not None:
+            response = self.client.get('{}?{}'.format(reverse('cafe:orders'), query))
+            seen.extend(order.pk for order in response.context['order_list'])
+            query = response.context.get('next_page_query')
+        self.assertEqual(seen, expected)
+
+    def test_order_lists_malformed_cursor(self):
+        first_page = self.assertPageQueries(self.barist, reverse('cafe:orders'), 14)
+        for cursor in ('2020-13-01T00:00:00|5', 'yesterday|5', '2020-01-01T00:00:00|x', '|'):
+            response = self.assertPageQueries(self.barist, reverse('cafe:orders'), 14, data={'cursor': cursor})
+            self.assertEqual(list(response.context['order_list']), list(first_page.context['order_list']))
+
+    def test_order_lists_do_not_grow_with_orders(self):
+        self.client.force_login(self.barist)
+        urls = [reverse('cafe:orders'), reverse('cafe:online-orders')]
+        before = []
+        for url in urls:
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url)
+            before.append(len(context))
+        self.create_orders(100, random.Random(2))
+        for url, number in zip(urls, before):
+            cache.clear()
+            self.assertPageQueries(None, url, number)
+
+    def test_storage(self):
+        self.assertPageQueries(self.barist, reverse('cafe:storage'), 6)
+
+    def test_create_order(self):
+        data = {'shop': self.shops[0].pk, 'payment_type': 1}
+        data.update(('quantity_{}'.format(product.pk), 1) for product in self.products[1:4])
+        self.assertPageQueries(self.client_user, reverse('cafe:add-order'), 24, status_code=302, data=data, method='post')
+        self.assertPageQueries(self.barist, reverse('cafe:add-order'), 21, status_code=302, data=data, method='post')
+
+    def test_create_order_quantities(self):
+        latte, mocha = self.products[1], self.products[2]
+        storage = dict(StorageState.objects.filter(shop=self.shops[0]).values_list('ingredient', 'amount'))
+        self.client.force_login(self.barist)
+        self.client.post(reverse('cafe:add-order'), {
+            'shop': self.shops[0].pk, 'payment_type': 1, 'quantity_{}'.format(latte.pk): 2,
+            'quantity_{}'.format(mocha.pk): 1
+        })
+        order = Order.objects.latest('pk')
+        self.assertEqual(order.amount, latte.price * 2 + mocha.price)
+        self.assertEqual(
+            set(order.orderproduct_set.values_list('product', 'quantity', 'unit_price')),
+            {(latte.pk, 2, latte.price), (mocha.pk, 1, mocha.price)}
+        )
+        used = {}
+        for product, quantity in ((latte, 2), (mocha, 1)):
+            for line in ProductIngredient.objects.filter(product=product):
+                used[line.ingredient_id] = used.get(line.ingredient_id, 0) + line.amount * quantity
+        for ingredient, amount in StorageState.objects.filter(shop=self.shops[0]).values_list('ingredient', 'amount'):
+            self.assertEqual(amount, storage[ingredient] - used.get(ingredient, 0))
+        sales = DailySales.objects.filter(date=order.timestamp.date(), shop=order.shop, employee=self.barist)
+        before = dict(sales.values_list('product', 'order_count'))
+        rebuild_daily_sales()
+        self.assertEqual(dict(sales.values_list('product', 'order_count')), before)
+        self.assertGreaterEqual(before[latte.pk], 2)
+
+    def test_create_order_charges_current_prices(self):
+        latte = Product.objects.get(pk=self.products[1].pk)
+        get_current_menu()
+        latte.price = Decimal('9.99')
+        latte.save()
+        self.client.force_login(self.barist)
+        self.client.post(reverse('cafe:add-order'), {
+            'shop': self.shops[0].pk, 'payment_type': 1, 'quantity_{}'.format(latte.pk): 2
+        })
+        order = Order.objects.latest('pk')
+        self.assertEqual(order.amount, Decimal('19.98'))
+        self.assertEqual(order.orderproduct_set.get().unit_price, Decimal('9.99'))
+
+    def test_create_order_rechecks_locked_stock(self):
+        latte = self.products[1]
+        ingredients = ProductIngredient.objects.filter(product=latte).values_list('ingredient', flat=True)
+        StorageState.objects.filter(shop=self.shops[0], ingredient__in=ingredients).update(amount=0)
+        orders = Order.objects.count()
+        self.client.force_login(self.barist)
+        # Validation passed before another order used the stock up.
+        with mock.patch('cafe.forms.get_missing_ingredients', return_value=[]):
+            response = self.client.post(reverse('cafe:add-order'), {
+                'shop': self.shops[0].pk, 'payment_type': 1, 'quantity_{}'.format(latte.pk): 1
+            }, follow=True)
+        self.assertContains(response, 'Not enough ingredients to prepare these products')
+        self.assertEqual(Order.objects.count(), orders)
+        self.assertFalse(StorageState.objects.filter(shop=self.shops[0], amount__lt=0).exists())
+
+    def test_reports_cache_kept_for_orders_of_today(self):
+        today, yesterday = Order.objects.order_by('pk')[:2]
+        Order.objects.filter(pk=yesterday.pk).update(timestamp=timezone.now() - timedelta(days=1))
+        yesterday.refresh_from_db()
+        with mock.patch('cafe.services.transaction.on_commit') as on_commit:
+            update_daily_sales(today, 1)
+            on_commit.assert_not_called()
+            update_daily_sales(yesterday, -1)
+            on_commit.assert_called_once_with(clear_reports_cache)
+
+    def test_reports_cache_version_never_repeats(self):
+        first = get_reports_cache_version()
+        clear_reports_cache()
+        self.assertEqual(get_reports_cache_version(), first + 1)
+        # Culled or evicted by the cache backend.
+        cache.delete(REPORTS_CACHE_VERSION_KEY)
+        with mock.patch('cafe.models.time.time', return_value=first / 1000 + 60):
+            self.assertGreater(get_reports_cache_version(), first + 1)
+
+    def test_change_order(self):
+        order = Order.objects.filter(client__isnull=False).first()
+        url = reverse('cafe:change-order', kwargs={'pk': order.pk})
+        self.assertPageQueries(self.barist, url, 15, status_code=302, data={'change': 'Accept'}, method='post')
+        self.assertPageQueries(self.barist, url, 12, status_code=302, data={'change': 'Cancel'}, method='post')
+
+    def test_add_supply(self):
+        data = {
+            'shop': self.shops[1].pk, 'description': '', 'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 0,
+            'form-0-ingredient': self.ingredients[0].pk, 'form-0-amount': 5,
+            'form-1-ingredient': self.ingredients[1].pk, 'form-1-amount': 7,
+            'form-2-ingredient': self.ingredients[0].pk, 'form-2-amount': 1,
+        }
+        self.assertPageQueries(self.barist, reverse('cafe:add-supply'), 18, status_code=302, data=data, method='post')
+
+    def test_add_supply_invalid_ingredients(self):
+        supplies = Supply.objects.count()
+        storage = list(StorageState.objects.order_by('pk').values_list('amount', flat=True))
+        self.client.force_login(self.barist)
+        data = {
+            'shop': self.shops[1].pk, 'description': '', 'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 0,
+            'form-0-ingredient': self.ingredients[0].pk, 'form-0-amount': 5,
+            'form-1-ingredient': self.ingredients[1].pk, 'form-1-amount': 'a lot',
+        }
+        response = self.client.post(reverse('cafe:add-supply'), data, follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']], ['Ingredient 2: Enter a whole number.']
+        )
+        data.update({'form-TOTAL_FORMS': 1, 'form-0-ingredient': '', 'form-0-amount': ''})
+        response = self.client.post(reverse('cafe:add-supply'), data, follow=True)
+        self.assertEqual([str(message) for message in response.context['messages']], ['Add at least one ingredient'])
+        self.assertEqual(Supply.objects.count(), supplies)
+        self.assertEqual(list(StorageState.objects.order_by('pk').values_list('amount', flat=True)), storage)
+
+
+class CafeReportsTest(CafeFixturesMixin, TestCase):
+    def test_reports_match_orders(self):
+        rng = random.Random(3)
+        ProductIngredient.objects.filter(
+            pk__in=ProductIngredient.objects.order_by('pk').values_list('pk', flat=True)[::2]
+        ).update(amount=Decimal('0.25'))
+        days = [date(2001, 1, 1), date(2001, 1, 2)]
+        raw = []
+        for day in days:
+            for shop in self.shops[:2]:
+                for _ in range(6):
+                    order = Order.objects.create(
+                        amount=Decimal('10'), shop=shop, employee=rng.choice(self.employees[:4]), order_status_id=2,
+                        payment_type=self.payment_type
+                    )
+                    Order.objects.filter(pk=order.pk).update(
+                        timestamp=timezone.make_aware(datetime.combine(day, time(12)))
+                    )
+                    order.refresh_from_db()
+                    products = rng.sample(self.products, 2)
+                    OrderProduct.objects.bulk_create([
+                        OrderProduct(order=order, product=product, quantity=rng.randint(1, 3), unit_price=product.price)
+                        for product in products
+                    ])
+                    quantities = get_order_quantities(order)
+                    update_daily_sales(order, 1, quantities)
+                    raw.append((day, shop, order.employee_id, quantities))
+        amounts = list(ProductIngredient.objects.values_list('product', 'ingredient', 'amount'))
+
+        def expected(start_date, end_date, shop):
+            products, employees, ingredients = {}, {}, {}
+            for day, order_shop, employee_id, quantities in raw:
+                if not start_date <= day < end_date or shop not in (None, order_shop):
+                    continue
+                employees[employee_id] = employees.get(employee_id, 0) + 1
+                for product_id, quantity in quantities.items():
+                    products[product_id] = products.get(product_id, 0) + quantity
+                for product_id, ingredient_id, amount in amounts:
+                    if product_id in quantities:
+                        ingredients[ingredient_id] = ingredients.get(ingredient_id, 0) + amount * quantities[product_id]
+            return products, employees, ingredients
+
+        def report(start_date, end_date, shop):
+            return (
+                {product.pk: product.order_count for product in get_product_order_report(start_date, end_date, shop)
+                 if product.order_count},
+                {user.pk: user.order_count for user in get_employee_order_report(start_date, end_date, shop)
+                 if user.order_count},
+                {ingredient.pk: ingredient.ingredient_sum
+                 for ingredient in get_ingredient_usage(start_date, end_date, shop) if ingredient.ingredient_sum},
+            )
+
+        ranges = [
+            (days[0], days[1] + timedelta(days=1), None), (days[0], days[1] + timedelta(days=1), self.shops[0]),
+            (days[1], days[1] + timedelta(days=1), None), (days[0], days[1], self.shops[1]),
+            (days[0], days[1] + timedelta(days=1), self.shops[2]),
+        ]
+        for start_date, end_date, shop in ranges:
+            self.assertEqual(report(start_date, end_date, shop), expected(start_date, end_date, shop))
+        rebuild_daily_sales()
+        for start_date, end_date, shop in ranges:
+            self.assertEqual(report(start_date, end_date, shop), expected(start_date, end_date, shop))
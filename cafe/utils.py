@@ -0,0 +1,142 @@
+import csv
+import json
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.http import StreamingHttpResponse, HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from cafe.models import get_public_pages_cache_version
+
+
+class KeysetPaginationMixin:
+    paginate_by = 20
+    cursor_kwarg = 'cursor'
+    cursor_field = 'timestamp'
+    next_cursor = None
+
+    def get_cursor(self):
+        value, _, pk = self.request.GET.get(self.cursor_kwarg, '').rpartition('|')
+        try:
+            value = parse_datetime(value) if value else None
+        except ValueError:
+            # Well formatted but impossible dates, e.g. month 13.
+            return None
+        if value is None or not pk.isdigit():
+            return None
+        return value, int(pk)
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.get_cursor()
+        if cursor:
+            value, pk = cursor
+            # The redundant __lte bound is what lets the database seek the (..., -timestamp, -id) index instead of
+            # scanning and discarding everything before the cursor, the OR alone can't be used as a range.
+            queryset = queryset.filter(
+                Q(**{'{}__lte'.format(self.cursor_field): value}),
+                Q(**{'{}__lt'.format(self.cursor_field): value}) | Q(**{self.cursor_field: value, 'pk__lt': pk})
+            )
+        object_list = list(queryset.order_by('-{}'.format(self.cursor_field), '-pk')[:page_size + 1])
+        is_paginated = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        if is_paginated:
+            last = object_list[-1]
+            self.next_cursor = '{}|{}'.format(getattr(last, self.cursor_field).isoformat(), last.pk)
+        return None, None, object_list, is_paginated
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        query.pop(self.cursor_kwarg, None)
+        context.update({'cursor': self.get_cursor(), 'first_page_query': query.urlencode()})
+        if self.next_cursor:
+            query[self.cursor_kwarg] = self.next_cursor
+            context.update({'next_page_query': query.urlencode()})
+        return context
+
+
+class PublicPageCacheMixin:
+    cache_version = None
+
+    def get_cache_timeout(self):
+        return settings.PUBLIC_PAGE_CACHE_TIMEOUT
+
+    def get_page_cache_key(self):
+        return 'cafe:public-page:{}:{}:{}'.format(
+            self.cache_version, timezone.localdate().isoformat(), self.request.path
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        self.cache_version = get_public_pages_cache_version()
+        if request.method != 'GET' or request.user.is_authenticated or get_messages(request):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key()
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.render()
+            cache.set(key, response.content, self.get_cache_timeout())
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(public_cache_version=self.cache_version, public_cache_timeout=self.get_cache_timeout())
+        return context
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ReportExportMixin:
+    export_kwarg = 'export'
+    export_fields = ()
+    export_filename = 'report'
+
+    def get(self, request, *args, **kwargs):
+        export = request.GET.get(self.export_kwarg)
+        if export == 'csv':
+            return self.export_response(self.iter_csv(), 'text/csv', 'csv')
+        if export == 'json':
+            return self.export_response(self.iter_json(), 'application/x-ndjson', 'jsonl')
+        return super().get(request, *args, **kwargs)
+
+    def export_response(self, rows, content_type, extension):
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.export_filename, extension)
+        return response
+
+    def get_report_queryset(self):
+        return self.get_queryset()
+
+    def iter_rows(self):
+        objects = self.get_report_queryset()
+        if isinstance(objects, QuerySet):
+            objects = objects.iterator()
+        for obj in objects:
+            yield [self.get_export_value(obj, path) for _, path in self.export_fields]
+
+    def get_export_value(self, obj, path):
+        for attr in path.split('.'):
+            obj = getattr(obj, attr, None)
+            if obj is None:
+                return None
+        return obj() if callable(obj) else obj
+
+    def iter_csv(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow([column for column, _ in self.export_fields])
+        for row in self.iter_rows():
+            yield writer.writerow(row)
+
+    def iter_json(self):
+        columns = [column for column, _ in self.export_fields]
+        for row in self.iter_rows():
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
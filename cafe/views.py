@@ -1,64 +1,76 @@
-from datetime import datetime
+from datetime import datetime, date
 
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum, Count, Case, When, IntegerField, Q
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy, reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import ListView, TemplateView, FormView
 
 from cafe.filters import OrdersFilter
 from cafe.forms import CreateOrderForm, SupplyForm, SupplyIngredientFormSet, FilterForm
-from cafe.models import Shop, Cafe, Menu, Order, OrderStatus, StorageState, Supply, SuppliedIngredient, Product, \
-    Ingredient
+from cafe.models import Shop, Cafe, Order, OrderProduct, OrderStatus, StorageState, Supply, \
+    SuppliedIngredient, get_reports_cache_version
+from cafe.services import get_ingredient_usage, deduct_ingredients, get_current_menu, update_daily_sales, \
+    get_product_order_report, get_employee_order_report, receive_supply, get_order_quantities
+from cafe.utils import KeysetPaginationMixin, ReportExportMixin, PublicPageCacheMixin
 from users.forms import AddSalaryForm
-from users.models import Salary, Employee, User
+from users.models import Salary
 from users.utils import EmployeeRequiredMixin, AdminRequiredMixin
 
+ORDER_LINES = Prefetch('orderproduct_set', queryset=OrderProduct.objects.select_related('product'))
 
-class ShopsView(ListView):
+
+class ShopsView(PublicPageCacheMixin, ListView):
     template_name = 'cafe/shops.html'
-    queryset = Shop.objects.all()
+    queryset = Shop.objects.select_related('address')
 
 
-class CafeView(TemplateView):
+class CafeView(PublicPageCacheMixin, TemplateView):
     template_name = 'cafe/cafe.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update(cafe=Cafe.objects.first())
+        context.update(cafe=SimpleLazyObject(Cafe.objects.select_related('address').first))
         return context
 
 
-class MenuView(TemplateView):
+class MenuView(PublicPageCacheMixin, TemplateView):
     template_name = 'cafe/menu.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update(menu=Menu.objects.filter(
-            start_date__lte=datetime.today().date(), end_date__gte=datetime.today().date()
-        ).last())
+        context.update(menu=get_current_menu())
         return context
 
 
-class OrderListView(EmployeeRequiredMixin, ListView):
+class OrderListView(EmployeeRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'cafe/orders.html'
+    context_object_name = 'order_list'
 
     def get_queryset(self):
-        return OrdersFilter(self.request.GET, queryset=Order.objects.filter(client__isnull=True))
+        self.filter = OrdersFilter(self.request.GET, queryset=Order.objects.filter(client__isnull=True))
+        return self.filter.qs.select_related('employee', 'shop').prefetch_related(ORDER_LINES)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
-        context.update({'form': CreateOrderForm})
+        context.update({'form': CreateOrderForm, 'filter': self.filter})
         return context
 
 
-class OnlineOrderListView(LoginRequiredMixin, ListView):
+class OnlineOrderListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'cafe/online_orders.html'
+    context_object_name = 'order_list'
 
     def get_queryset(self):
-        return Order.objects.filter(client__isnull=False) if hasattr(self.request.user, 'employee') else Order.objects.filter(client=self.request.user)
+        queryset = Order.objects.filter(client__isnull=False) if self.request.user.is_employee else Order.objects.filter(client=self.request.user)
+        return queryset.select_related('client', 'employee', 'shop', 'order_status').prefetch_related(ORDER_LINES)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
@@ -77,33 +89,37 @@ class CreateOrderView(LoginRequiredMixin, FormView):
         return super().get_success_url()
 
     def form_valid(self, form):
-        products = form.cleaned_data.pop('products')
-        amount = products.aggregate(Sum('price'))['price__sum']
-        if self.request.user.type == 'client':
-            order = Order.objects.create(
-                **form.cleaned_data, client=self.request.user,
-                order_status=OrderStatus.objects.filter(id=1).last(),
-                amount=amount
-            )
-        else:
-            order = Order.objects.create(
-                **form.cleaned_data, employee=self.request.user,
-                order_status=OrderStatus.objects.filter(id=2).last(),
-                amount=amount
-            )
-        for product in products:
-            for ingredient in product.ingredients.all():
-                storage = StorageState.objects.filter(shop=form.cleaned_data.get('shop'), ingredient=ingredient).last()
-                if storage:
-                    storage.amount = storage.amount - product.productingredient_set.get(ingredient=ingredient).amount
-                    storage.save()
-        order.products.set(products)
+        order = form.save(commit=False)
+        quantities = {product.pk: quantity for product, quantity in form.lines}
+        # The products come from the cached menu, which saving a Product clears, so these are the current prices
+        # the customer was shown and there is no need to read them again.
+        order.amount = sum(product.price * quantity for product, quantity in form.lines)
+        try:
+            with transaction.atomic():
+                if self.request.user.type == 'client':
+                    order.client = self.request.user
+                    order.order_status = OrderStatus.objects.filter(id=1).last()
+                else:
+                    order.employee = self.request.user
+                    order.order_status = OrderStatus.objects.filter(id=2).last()
+                order.save()
+                deduct_ingredients(order.shop, form.requirements)
+                OrderProduct.objects.bulk_create([
+                    OrderProduct(order=order, product=product, quantity=quantity, unit_price=product.price)
+                    for product, quantity in form.lines
+                ])
+                update_daily_sales(order, 1, quantities)
+        except ValidationError as error:
+            # Stock is checked again on the locked storage rows, another order may have used it up since validation.
+            form.add_error(None, error)
+            return self.form_invalid(form)
         messages.success(request=self.request, message='Order successfully made', extra_tags='success')
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        for error in form.errors['__all__'].data[0].messages:
-            messages.error(request=self.request, message=error, extra_tags='error')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -113,20 +129,28 @@ class UpdateOrderView(EmployeeRequiredMixin, FormView):
 
     def post(self, request, *args, **kwargs):
         order = get_object_or_404(Order, pk=kwargs.get('pk'))
+        quantities = get_order_quantities(order)
         if request.POST.get('change') == 'Cancel':
-            order.delete()
+            with transaction.atomic():
+                update_daily_sales(order, -1, quantities)
+                order.delete()
             messages.success(request=self.request, message='Order successfully deleted', extra_tags='success')
         else:
-            order.order_status_id = 2
-            order.employee = request.user
-            order.save()
+            with transaction.atomic():
+                update_daily_sales(order, -1, quantities)
+                order.order_status_id = 2
+                order.employee = request.user
+                order.save()
+                update_daily_sales(order, 1, quantities)
             messages.success(request=self.request, message='Order successfully updated', extra_tags='success')
         return HttpResponseRedirect(self.success_url)
 
 
 class StorageView(EmployeeRequiredMixin, ListView):
     template_name = 'cafe/storage.html'
-    queryset = Shop.objects.all()
+    queryset = Shop.objects.prefetch_related(
+        Prefetch('storagestate_set', queryset=StorageState.objects.select_related('ingredient__unit_type'))
+    )
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
@@ -140,34 +164,38 @@ class CreateSupplyView(EmployeeRequiredMixin, FormView):
     form_class = SupplyForm
 
     def form_valid(self, form):
-        supply = Supply.objects.create(date=datetime.today().date(), **form.cleaned_data)
         formset = SupplyIngredientFormSet(self.request.POST)
-        if formset.is_valid():
-            for f in formset:
-                SuppliedIngredient.objects.create(supply=supply, **f.cleaned_data)
-                ss = StorageState.objects.filter(
-                    shop=form.cleaned_data.get('shop'), ingredient=f.cleaned_data.get('ingredient')
-                ).last()
-                if ss:
-                    ss.amount = ss.amount + f.cleaned_data.get('amount')
-                    ss.save()
-                else:
-                    StorageState.objects.create(
-                        shop=form.cleaned_data.get('shop'), ingredient=f.cleaned_data.get('ingredient'), amount=f.cleaned_data.get('amount')
-                    )
-
-            messages.success(request=self.request, message='Supply successfully ordered', extra_tags='success')
+        if not formset.is_valid():
+            errors = list(formset.non_form_errors())
+            for line, form_errors in enumerate(formset.errors, start=1):
+                errors.extend(
+                    'Ingredient {}: {}'.format(line, error) for field_errors in form_errors.values() for error in field_errors
+                )
+            form.add_error(None, errors)
+            return self.form_invalid(form)
+        lines = [(f.cleaned_data['ingredient'], f.cleaned_data['amount']) for f in formset if f.cleaned_data]
+        if not lines:
+            form.add_error(None, 'Add at least one ingredient')
+            return self.form_invalid(form)
+
+        with transaction.atomic():
+            supply = Supply.objects.create(date=datetime.today().date(), **form.cleaned_data)
+            receive_supply(supply, lines)
+        messages.success(request=self.request, message='Supply successfully ordered', extra_tags='success')
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        for error in form.errors['__all__'].data[0].messages:
-            messages.error(request=self.request, message=error, extra_tags='error')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
         return HttpResponseRedirect(self.get_success_url())
 
 
 class SupplyListView(AdminRequiredMixin, ListView):
     template_name = 'cafe/supplies.html'
-    queryset = Supply.objects.all()
+    queryset = Supply.objects.select_related('shop').prefetch_related(
+        Prefetch('suppliedingredient_set', queryset=SuppliedIngredient.objects.select_related('ingredient__unit_type'))
+    )
     ordering = ('-date', '-pk')
 
     def get_context_data(self, *, object_list=None, **kwargs):
@@ -180,7 +208,8 @@ class SalaryListView(EmployeeRequiredMixin, ListView):
     template_name = 'users/salaries.html'
 
     def get_queryset(self):
-        return Salary.objects.all() if self.request.user.employee.job_title == Employee.ADMIN else Salary.objects.filter(user=self.request.user)
+        queryset = Salary.objects.select_related('user')
+        return queryset if self.request.user.is_admin else queryset.filter(user=self.request.user)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
@@ -207,85 +236,87 @@ class ReportsView(AdminRequiredMixin, TemplateView):
     template_name = 'cafe/reports.html'
 
 
-class ProductOrderReportView(AdminRequiredMixin, ListView):
-    template_name = 'cafe/order-report.html'
+class BaseReportView(AdminRequiredMixin, ReportExportMixin, ListView):
+    report_name = None
+    cache_timeout = 60 * 60
+    live_cache_timeout = 60
+    default_start_date = date(2000, 1, 1)
+    default_end_date = date(2100, 1, 1)
+
+    def get(self, request, *args, **kwargs):
+        self.filter_form = FilterForm(request.GET)
+        if not self.filter_form.is_valid():
+            for errors in self.filter_form.errors.values():
+                for error in errors:
+                    messages.error(request=self.request, message=error, extra_tags='error')
+            # Render the page with the errors and no report, not an export of the wrong range.
+            return super(ReportExportMixin, self).get(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
+
+    def get_report_range(self):
+        cleaned_data = self.filter_form.cleaned_data
+        return (
+            cleaned_data.get('start_date') or self.default_start_date,
+            cleaned_data.get('end_date') or self.default_end_date,
+            cleaned_data.get('shop'),
+        )
+
+    def get_report(self, start_date, end_date, shop):
+        raise NotImplementedError
+
+    def get_report_queryset(self):
+        return self.get_report(*self.get_report_range())
 
     def get_queryset(self):
-        start_date = datetime.strptime("01/01/2000" if self.request.GET.get('start_date') == '' else self.request.GET.get('start_date', "01/01/2000"), '%m/%d/%Y')
-        end_date = datetime.strptime("01/01/2100" if self.request.GET.get('end_date') == '' else self.request.GET.get('end_date', "01/01/2100"), '%m/%d/%Y')
-        shop = self.request.GET.get('shop')
-
-        if shop:
-            return Product.objects.annotate(
-                order_count=Count(
-                    'orders', filter=Q(orders__shop=shop, orders__timestamp__range=[start_date, end_date])
-                )
-            )
-
-        return Product.objects.annotate(order_count=Count('orders', filter=Q(orders__timestamp__range=[start_date, end_date])))
+        if not self.filter_form.is_valid():
+            return []
+        start_date, end_date, shop = self.get_report_range()
+        key = 'cafe:report:{}:{}:{}:{}:{}'.format(
+            self.report_name, get_reports_cache_version(), shop.pk if shop else '', start_date, end_date
+        )
+        report = cache.get(key)
+        if report is None:
+            report = list(self.get_report(start_date, end_date, shop))
+            timeout = self.live_cache_timeout if start_date <= timezone.localdate() < end_date else self.cache_timeout
+            cache.set(key, report, timeout)
+        return report
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
-        context.update({'filter': FilterForm})
+        context.update({'filter': self.filter_form})
         return context
 
 
-class EmployeeOrderReportView(AdminRequiredMixin, ListView):
-    template_name = 'cafe/employee-order-report.html'
-
-    def get_queryset(self):
-        start_date = datetime.strptime("01/01/2000" if self.request.GET.get('start_date') == '' else self.request.GET.get('start_date', "01/01/2000"), '%m/%d/%Y')
-        end_date = datetime.strptime("01/01/2100" if self.request.GET.get('end_date') == '' else self.request.GET.get('end_date', "01/01/2100"), '%m/%d/%Y')
-        shop = self.request.GET.get('shop')
-
-        if shop:
-            return User.objects.filter(employee__isnull=False).annotate(
-                order_count=Count(
-                    'accepted_by', filter=Q(accepted_by__shop=shop, accepted_by__timestamp__range=[start_date, end_date])
-                )
-            )
+class ProductOrderReportView(BaseReportView):
+    template_name = 'cafe/order-report.html'
+    context_object_name = 'product_list'
+    report_name = 'product-order'
+    export_fields = (('product', 'name'), ('quantity', 'order_count'))
+    export_filename = 'product-order-report'
 
-        return User.objects.filter(employee__isnull=False).annotate(order_count=Count('accepted_by', filter=Q(accepted_by__timestamp__range=[start_date, end_date])))
+    def get_report(self, start_date, end_date, shop):
+        return get_product_order_report(start_date, end_date, shop)
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data(object_list=None, **kwargs)
-        context.update({'filter': FilterForm})
-        return context
 
+class EmployeeOrderReportView(BaseReportView):
+    template_name = 'cafe/employee-order-report.html'
+    context_object_name = 'user_list'
+    report_name = 'employee-order'
+    export_fields = (
+        ('employee', 'get_full_name'), ('job_title', 'employee.job_title'), ('order_count', 'order_count')
+    )
+    export_filename = 'employee-order-report'
 
-class IngredientUsageReportView(AdminRequiredMixin, ListView):
-    template_name = 'cafe/ingredient-report.html'
+    def get_report(self, start_date, end_date, shop):
+        return get_employee_order_report(start_date, end_date, shop)
 
-    def get_queryset(self):
-        start_date = datetime.strptime("01/01/2000" if self.request.GET.get('start_date') == '' else self.request.GET.get('start_date', "01/01/2000"), '%m/%d/%Y')
-        end_date = datetime.strptime("01/01/2100" if self.request.GET.get('end_date') == '' else self.request.GET.get('end_date', "01/01/2100"), '%m/%d/%Y')
-        shop = self.request.GET.get('shop')
-
-        ingredients = Ingredient.objects.all()
-
-        if shop:
-            for ingredient in ingredients:
-                amount = 0
-                for product in ingredient.products.all():
-                    for order in product.orders.filter(timestamp__range=[start_date, end_date], shop=shop):
-                        ingredient_in_product = order.products.annotate(
-                            ingredient_sum=Sum('productingredient__amount', filter=Q(
-                                productingredient__ingredient=ingredient))
-                        )
-                        amount += sum([x.ingredient_sum or 0 for x in ingredient_in_product])
-                ingredient.ingredient_sum = amount
-        else:
-            for ingredient in ingredients:
-                amount = 0
-                for product in ingredient.products.all():
-                    for order in product.orders.filter(timestamp__range=[start_date, end_date]):
-                        ingredient_in_product = order.products.annotate(ingredient_sum=Sum('productingredient__amount', filter=Q(productingredient__ingredient=ingredient)))
-                        amount += sum([x.ingredient_sum or 0 for x in ingredient_in_product])
-                ingredient.ingredient_sum = amount
 
-        return ingredients
+class IngredientUsageReportView(BaseReportView):
+    template_name = 'cafe/ingredient-report.html'
+    context_object_name = 'ingredient_list'
+    report_name = 'ingredient-usage'
+    export_fields = (('ingredient', 'name'), ('amount', 'ingredient_sum'), ('unit', 'unit_type.name'))
+    export_filename = 'ingredient-report'
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data(object_list=None, **kwargs)
-        context.update({'filter': FilterForm})
-        return context
+    def get_report(self, start_date, end_date, shop):
+        return get_ingredient_usage(start_date, end_date, shop)
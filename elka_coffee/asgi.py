@@ -0,0 +1,24 @@
+"""
+ASGI config for elka_coffee project.
+
+Django 2.2 has no ASGI handler of its own, so the WSGI application is adapted with asgiref and every request runs
+in a worker thread. It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://github.com/django/asgiref
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+
+from elka_coffee.wsgi import application as wsgi_application
+
+
+def strip_headers_application(environ, start_response):
+    # Django 2.2 writes Set-Cookie values with a leading space, which WSGI servers tolerate but h11 rejects.
+    def strip_start_response(status, headers, exc_info=None):
+        return start_response(status, [(name, value.strip()) for name, value in headers], exc_info)
+
+    return wsgi_application(environ, strip_start_response)
+
+
+application = WsgiToAsgi(strip_headers_application)
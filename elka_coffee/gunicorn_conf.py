@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration for elka_coffee.
+
+Run with ``gunicorn -c python:elka_coffee.gunicorn_conf elka_coffee.wsgi``, every value can be overridden through the
+environment. For more information on the settings, see
+http://docs.gunicorn.org/en/19.9.0/settings.html
+"""
+
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', 8000)))
+
+# Threaded workers by default: the views spend most of their time waiting for PostgreSQL, so a few threads per
+# process keep the CPUs busy without the memory of extra processes. 'gevent' needs gevent and psycogreen installed,
+# 'uvicorn.workers.UvicornWorker' needs uvicorn and elka_coffee.asgi:application instead of the WSGI application.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Load Django and warm the templates once in the master so workers share that memory. gevent has to patch the
+# standard library before Django is imported, so the application is loaded in every worker instead.
+preload_app = worker_class != 'gevent'
+
+# Report exports stream for a while, give them time to finish before a worker is killed or replaced on reload.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow memory growth doesn't pile up, with jitter so they don't restart at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def on_starting(server):
+    # Cache invalidation bumps version keys, which a per-process local memory cache can't share between workers.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elka_coffee.settings.settings')
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+    if server.cfg.workers > 1 and settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+        raise ImproperlyConfigured(
+            'The local memory cache is not shared between {} workers, set CACHE_BACKEND to file, memcached or '
+            'redis'.format(server.cfg.workers)
+        )
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
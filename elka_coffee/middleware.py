@@ -0,0 +1,108 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('elka_coffee.requests')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        start = time.perf_counter()
+        with self.count_queries(stats):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        render_duration = getattr(request, 'render_duration', 0)
+        response['Server-Timing'] = 'db;dur={:.1f};desc="{} queries", render;dur={:.1f}, view;dur={:.1f}'.format(
+            stats.duration * 1000, stats.count, render_duration * 1000, duration * 1000
+        )
+        if response.streaming:
+            # Streamed exports fetch their rows while the body is sent, after the headers above went out, so they are
+            # only counted in the log line (and not in the budget), which is written once the stream is consumed.
+            response.streaming_content = self.stream(
+                response.streaming_content, stats, request, response, view_name, render_duration, start
+            )
+        else:
+            self.log(request, response, view_name, stats, render_duration, duration)
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and stats.count > budget:
+            message = '{} issued {} queries, budget is {}'.format(view_name, stats.count, budget)
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    @contextmanager
+    def count_queries(self, stats):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            yield
+
+    def stream(self, content, stats, request, response, view_name, render_duration, start):
+        try:
+            with self.count_queries(stats):
+                yield from content
+        finally:
+            self.log(request, response, view_name, stats, render_duration, time.perf_counter() - start)
+
+    def log(self, request, response, view_name, stats, render_duration, duration):
+        # Only slow requests are logged at INFO, the rest at DEBUG so they don't flood the console (and test output).
+        level = logging.INFO if duration * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 0) else logging.DEBUG
+        logger.log(
+            level, 'view=%s method=%s status=%s queries=%d db_ms=%.1f render_ms=%.1f view_ms=%.1f', view_name,
+            request.method, response.status_code, stats.count, stats.duration * 1000, render_duration * 1000,
+            duration * 1000,
+            extra={'view_name': view_name, 'queries': stats.count, 'db_ms': stats.duration * 1000,
+                   'render_ms': render_duration * 1000, 'view_ms': duration * 1000}
+        )
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def set_render_duration(response):
+            request.render_duration = time.perf_counter() - start
+
+        response.add_post_render_callback(set_render_duration)
+        return response
+
+
+class DatabaseHealthCheckMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_HEALTH_CHECKS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            if connection.connection is not None and not connection.is_usable():
+                connection.close()
+        return self.get_response(request)
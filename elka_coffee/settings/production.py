@@ -1,4 +1,4 @@
-import dj_database_url
+import os
 
 from elka_coffee.settings.settings import *
 
@@ -6,4 +6,22 @@ ALLOWED_HOSTS = ['elka-coffee.herokuapp.com']
 
 DEBUG = False
 
-DATABASES['default'] = dj_database_url.config(default=os.environ.get('DATABASE_URL'))
+# Compile every template once per worker and keep it in memory, warmed up when the WSGI application is loaded.
+# Form widgets are rendered through the same engine so their templates are cached and warmed up as well.
+TEMPLATES = [dict(TEMPLATES[0], APP_DIRS=False, OPTIONS=dict(TEMPLATES[0]['OPTIONS'], debug=False, loaders=[
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]))]
+INSTALLED_APPS = INSTALLED_APPS + ['django.forms']
+FORM_RENDERER = 'django.forms.renderers.TemplatesSetting'
+TEMPLATE_WARMUP = True
+
+# Every gunicorn worker has its own local memory cache, so version bumps made by one worker would never reach the
+# others. Default to the file-based cache shared by all workers on the host, set CACHE_BACKEND to redis or memcached
+# when running on more than one host.
+if 'CACHE_BACKEND' not in os.environ:
+    CACHES['default'].update(
+        BACKEND=CACHE_BACKENDS['file'][0], LOCATION=os.environ.get('CACHE_LOCATION', CACHE_BACKENDS['file'][1])
+    )
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+import dj_database_url
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 from django.urls import reverse_lazy
 
@@ -47,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'elka_coffee.middleware.QueryTimingMiddleware',
+    'elka_coffee.middleware.DatabaseHealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,6 +80,9 @@ TEMPLATES = [
     },
 ]
 
+# Compile all templates when the WSGI application is loaded, only useful with the cached loader (production).
+TEMPLATE_WARMUP = bool(os.environ.get('TEMPLATE_WARMUP'))
+
 WSGI_APPLICATION = 'elka_coffee.wsgi.application'
 
 
@@ -83,15 +90,46 @@ WSGI_APPLICATION = 'elka_coffee.wsgi.application'
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
 DATABASES = {
+    'default': dj_database_url.config(
+        default='postgres://postgres@postgres:5432/postgres', conn_max_age=int(os.environ.get('CONN_MAX_AGE', 60))
+    )
+}
+
+# Behind pgbouncer in transaction pooling mode a connection may be handed to another client between transactions,
+# so named server-side cursors (used by QuerySet.iterator()) can't be kept open.
+if os.environ.get('PGBOUNCER'):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Ping persistent connections at the start of every request and drop the ones the server has closed.
+DATABASE_HEALTH_CHECKS = bool(os.environ.get('DATABASE_HEALTH_CHECKS'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# CACHE_BACKEND picks one of the aliases below (or a full backend path), CACHE_LOCATION is passed through as is.
+# Local memory is the default and stands in for Redis in development, the redis alias needs django-redis installed.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'elka-coffee'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, '../.cache')),
+    'memcached': ('django.core.cache.backends.memcached.MemcachedCache', '127.0.0.1:11211'),
+    'redis': ('django_redis.cache.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS.get(
+    os.environ.get('CACHE_BACKEND', 'locmem'), (os.environ.get('CACHE_BACKEND'), '')
+)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'HOST': 'postgres',
-        'PORT': 5432,
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_LOCATION),
+        'KEY_PREFIX': 'elka-coffee',
     }
 }
 
+# Seconds the shop list, about us and current menu pages are kept for, edits invalidate them straight away.
+PUBLIC_PAGE_CACHE_TIMEOUT = int(os.environ.get('PUBLIC_PAGE_CACHE_TIMEOUT', 60 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -139,7 +177,46 @@ STATIC_ROOT = 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.django.GzipManifestStaticFilesStorage'
 
 AUTH_USER_MODEL = 'users.User'
+# ModelBackend stays listed so sessions created before RoleModelBackend (which store its path) remain valid.
+AUTHENTICATION_BACKENDS = ['users.backends.RoleModelBackend', 'django.contrib.auth.backends.ModelBackend']
 LOGIN_REDIRECT_URL = reverse_lazy('users:index')
 LOGOUT_REDIRECT_URL = reverse_lazy('users:login')
 LOGIN_URL = reverse_lazy('users:login')
 LOGOUT_URL = reverse_lazy('users:logout')
+
+# Per-view SQL query budgets checked by QueryTimingMiddleware, keyed by URL name.
+# Exceeding a budget logs a warning, or raises when QUERY_BUDGET_STRICT is on (tests).
+
+QUERY_BUDGETS = {
+    'cafe:menu': 5,
+    'cafe:orders': 16,
+    'cafe:online-orders': 10,
+    'cafe:storage': 14,
+    'users:bookings': 8,
+    'users:schedules': 10,
+    'users:salaries': 6,
+    'users:supplies': 12,
+    'users:order-report': 6,
+    'users:employee-order-report': 6,
+    'users:ingredient-report': 6,
+}
+QUERY_BUDGET_STRICT = False
+
+# Requests slower than this are logged at INFO by QueryTimingMiddleware, faster ones at DEBUG.
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'elka_coffee.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,39 @@
+import logging
+import os
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+
+def get_template_dirs(engine):
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            yield from getattr(inner, 'get_dirs', list)()
+
+
+def get_template_names(engine):
+    names = set()
+    for directory in get_template_dirs(engine):
+        for root, _, files in os.walk(directory):
+            names.update(
+                os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                for filename in files if filename.endswith('.html')
+            )
+    return sorted(names)
+
+
+def warm_templates():
+    count = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in get_template_names(backend.engine):
+            try:
+                backend.engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                logger.debug('Skipped template %s: %s', name, e)
+            else:
+                count += 1
+    return count
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from elka_coffee.warmup import warm_templates
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elka_coffee.settings.settings')
 
 application = get_wsgi_application()
+
+if settings.TEMPLATE_WARMUP:
+    warm_templates()
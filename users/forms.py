@@ -1,14 +1,17 @@
+import csv
 import datetime
 
 from bootstrap_datepicker_plus import DatePickerInput, TimePickerInput
 from django import forms
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
 from django.forms import ModelForm, Form
+from django.utils.timezone import make_aware
 from django.utils.translation import ugettext_lazy as _
 
-from cafe.models import Shop, Table
+from cafe.models import Shop
 from users.models import Client, Salary, Schedule, Employee
+from users.services import get_available_tables, allocate_tables, get_schedule_conflicts, read_roster, \
+    ROSTER_FIELDS, NO_TABLES_MESSAGE
 
 User = get_user_model()
 
@@ -67,41 +70,47 @@ class CustomEmployeeForm(ModelForm):
 
 class BookingForm(Form):
     shop = forms.ModelChoiceField(queryset=Shop.objects.all(), required=True, label='Coffeehouse', initial=1)
-    number_of_guests = forms.IntegerField(required=True, label='How many seats you need', initial=5)
+    number_of_guests = forms.IntegerField(required=True, label='How many seats you need', initial=5, min_value=1)
     date = forms.DateField(required=True, widget=DatePickerInput(format='%m/%d/%Y'))
     start_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
     end_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
 
     def clean_start_time(self):
-        date = self.cleaned_data.get('date')
-        start_time = self.cleaned_data.get('start_time')
-        return datetime.datetime(
-            year=date.year, month=date.month, day=date.day, hour=start_time.hour, minute=start_time.minute
-        )
+        return self.combine_with_date(self.cleaned_data.get('start_time'))
 
     def clean_end_time(self):
+        return self.combine_with_date(self.cleaned_data.get('end_time'))
+
+    def combine_with_date(self, value):
         date = self.cleaned_data.get('date')
-        end_time = self.cleaned_data.get('end_time')
-        return datetime.datetime(
-            year=date.year, month=date.month, day=date.day, hour=end_time.hour, minute=end_time.minute
-        )
+        if date is None:
+            # The date field reports its own error, clean() then skips the checks that need a full datetime.
+            return value
+        return make_aware(datetime.datetime(
+            year=date.year, month=date.month, day=date.day, hour=value.hour, minute=value.minute
+        ))
 
     def clean(self):
-        if self.cleaned_data.get('start_time') > self.cleaned_data.get('end_time'):
-            raise forms.ValidationError('Start time can\'t be later than end time')
-
         shop = self.cleaned_data.get('shop')
         start_time = self.cleaned_data.get('start_time')
         end_time = self.cleaned_data.get('end_time')
+        if None in (shop, self.cleaned_data.get('date'), start_time, end_time):
+            return
+
+        if start_time > end_time:
+            raise forms.ValidationError('Start time can\'t be later than end time')
         if shop.start_time > start_time.time() or shop.close_time < end_time.time():
             raise forms.ValidationError('This coffee house is open between {} and {}'.format(shop.start_time, shop.close_time))
 
-        available_tables = Table.objects.filter(shop=self.cleaned_data.get('shop')).exclude(
-            bookings__start_time__range=[self.cleaned_data.get('start_time'), self.cleaned_data.get('end_time')],
-            bookings__end_time__range=[self.cleaned_data.get('start_time'), self.cleaned_data.get('end_time')],
-        )
-        if not available_tables or available_tables.aggregate(Sum('max_seats'))['max_seats__sum'] < self.cleaned_data.get('number_of_guests'):
-            raise forms.ValidationError('No tables available in this coffeehouse for given date')
+        number_of_guests = self.cleaned_data.get('number_of_guests')
+        if number_of_guests is None:
+            return
+        if not allocate_tables(get_available_tables(shop, start_time, end_time), number_of_guests):
+            raise forms.ValidationError(NO_TABLES_MESSAGE)
+
+
+class AvailabilityForm(Form):
+    date = forms.DateField(required=True)
 
 
 class SalaryForm(forms.ModelForm):
@@ -121,7 +130,24 @@ class AddSalaryForm(forms.ModelForm):
         fields = '__all__'
 
 
-class ScheduleForm(forms.ModelForm):
+class ScheduleConflictsMixin:
+    def clean(self):
+        cleaned_data = super().clean()
+        # Employees add their own shifts, these forms have no user field and get the user on the instance.
+        user = cleaned_data.get('user') if 'user' in self.fields else self.instance.user
+        week_day = cleaned_data.get('week_day')
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        if None in (user, week_day, start_time, end_time):
+            return cleaned_data
+        if start_time >= end_time:
+            raise forms.ValidationError('Start time has to be earlier than end time')
+        if get_schedule_conflicts(user, week_day, start_time, end_time, exclude=self.instance.pk).exists():
+            raise forms.ValidationError('Employee is busy then')
+        return cleaned_data
+
+
+class ScheduleForm(ScheduleConflictsMixin, forms.ModelForm):
     user = forms.ModelChoiceField(queryset=User.objects.filter(employee__isnull=False), label='Employee')
 
     class Meta:
@@ -129,7 +155,7 @@ class ScheduleForm(forms.ModelForm):
         fields = '__all__'
 
 
-class AddScheduleForm(forms.ModelForm):
+class AddScheduleForm(ScheduleConflictsMixin, forms.ModelForm):
     start_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
     end_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
     shop = forms.ModelChoiceField(queryset=Shop.objects.all(), label='Coffeehouse')
@@ -139,7 +165,7 @@ class AddScheduleForm(forms.ModelForm):
         exclude = ('user', 'approve_date')
 
 
-class AddAdminScheduleForm(forms.ModelForm):
+class AddAdminScheduleForm(ScheduleConflictsMixin, forms.ModelForm):
     start_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
     end_time = forms.TimeField(required=True, widget=TimePickerInput(format='H:m'))
     shop = forms.ModelChoiceField(queryset=Shop.objects.all(), label='Coffeehouse', required=True)
@@ -148,3 +174,23 @@ class AddAdminScheduleForm(forms.ModelForm):
     class Meta:
         model = Schedule
         exclude = ('approve_date',)
+
+
+class ScheduleRosterForm(Form):
+    roster = forms.FileField(help_text='CSV columns: {}'.format(', '.join(ROSTER_FIELDS)))
+
+    def clean_roster(self):
+        roster = self.cleaned_data.get('roster')
+        try:
+            lines = roster.read().decode('utf-8-sig').splitlines()
+        except UnicodeDecodeError:
+            raise forms.ValidationError('Roster has to be an UTF-8 encoded CSV file')
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or set(ROSTER_FIELDS) - set(reader.fieldnames):
+            raise forms.ValidationError('Roster needs columns: {}'.format(', '.join(ROSTER_FIELDS)))
+        self.schedules, errors = read_roster(reader, approve_date=datetime.date.today())
+        if errors:
+            raise forms.ValidationError(errors)
+        if not self.schedules:
+            raise forms.ValidationError('Roster is empty')
+        return roster
@@ -0,0 +1,33 @@
+# Generated by Django 2.2 on 2026-10-18 15:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafe', '0019_dailysales'),
+        ('users', '0012_auto_20190527_1922'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='schedule',
+            options={'ordering': ('-id',), 'verbose_name': 'schedule', 'verbose_name_plural': 'schedules'},
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='address',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cafe.Address'),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='job_title',
+            field=models.CharField(blank=True, choices=[('admin', 'Admin'), ('barist', 'Barist'), ('cashier', 'Cashier')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['end_time', 'start_time'], name='booking_interval_idx'),
+        ),
+    ]
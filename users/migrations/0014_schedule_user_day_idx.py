@@ -0,0 +1,17 @@
+# Generated by Django 2.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_booking_interval_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['user', 'week_day', 'start_time'], name='schedule_user_day_idx'),
+        ),
+    ]
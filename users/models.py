@@ -1,16 +1,39 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_save
 from django.dispatch import receiver
+from django.utils.timezone import localtime, is_aware
 from django.utils.translation import ugettext_lazy as _
 
+from cafe.models import get_cache_version, bump_cache_version
+
+
+def get_availability_cache_version(date):
+    return get_cache_version('users:availability-version:{}'.format(date.isoformat()))
+
+
+def clear_availability_cache(date):
+    bump_cache_version('users:availability-version:{}'.format(date.isoformat()))
+
 
 class User(AbstractUser):
     phone = models.CharField(max_length=12, blank=True)
 
     @property
     def type(self):
-        return 'client' if hasattr(self, 'client') else 'employee'
+        return 'client' if self.is_client else 'employee'
+
+    @property
+    def is_client(self):
+        return hasattr(self, 'client')
+
+    @property
+    def is_employee(self):
+        return hasattr(self, 'employee')
+
+    @property
+    def is_admin(self):
+        return self.is_employee and self.employee.job_title == Employee.ADMIN
 
     class Meta:
         verbose_name = _('user')
@@ -71,6 +94,9 @@ class Booking(models.Model):
         verbose_name = _('booking')
         verbose_name_plural = _('bookings')
         ordering = ('-start_time', '-end_time')
+        indexes = [
+            models.Index(fields=['end_time', 'start_time'], name='booking_interval_idx'),
+        ]
 
     def __str__(self):
         return str("{} {} - {}".format(self.user, self.start_time, self.end_time))
@@ -119,12 +145,32 @@ class Schedule(models.Model):
         verbose_name = _('schedule')
         verbose_name_plural = _('schedules')
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['user', 'week_day', 'start_time'], name='schedule_user_day_idx'),
+        ]
 
     def __str__(self):
         return str("{} {} {}".format(self.week_day, self.user, self.shop))
 
 
-@receiver(post_save, sender=User)
-def set_is_superuser(sender, instance, **kwargs):
-    if hasattr(instance, 'employee') and instance.employee.job_title == Employee.ADMIN:
-        sender.objects.filter(id=instance.id).update(is_superuser=True, is_staff=True)
+@receiver(pre_save, sender=User)
+def set_is_superuser(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None and instance.is_admin:
+        instance.is_superuser = instance.is_staff = True
+
+
+@receiver(post_save, sender=Employee)
+def set_employee_is_superuser(sender, instance, **kwargs):
+    if instance.job_title == Employee.ADMIN:
+        User.objects.filter(pk=instance.user_id).exclude(is_superuser=True, is_staff=True).update(
+            is_superuser=True, is_staff=True
+        )
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(m2m_changed, sender=Booking.tables.through)
+def clear_booking_availability(sender, instance, **kwargs):
+    if isinstance(instance, Booking):
+        for value in (instance.start_time, instance.end_time):
+            clear_availability_cache((localtime(value) if is_aware(value) else value).date())
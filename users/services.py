@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_time
+from django.utils.timezone import make_aware
+
+from cafe.models import Table, Shop
+from users.models import Booking, Schedule, User, get_availability_cache_version
+
+AVAILABILITY_SLOT_MINUTES = 30
+AVAILABILITY_CACHE_TIMEOUT = 60 * 10
+ROSTER_FIELDS = ('username', 'shop', 'week_day', 'start_time', 'end_time')
+NO_TABLES_MESSAGE = 'No tables available in this coffeehouse for given date'
+
+
+def get_available_tables(shop, start_time, end_time):
+    overlapping = Booking.tables.through.objects.filter(
+        table=OuterRef('pk'), booking__start_time__lt=end_time, booking__end_time__gt=start_time
+    )
+    return list(
+        Table.objects.filter(shop=shop).annotate(is_booked=Exists(overlapping)).filter(is_booked=False).order_by('number')
+    )
+
+
+def allocate_tables(tables, number_of_guests):
+    best = {0: ()}
+    for index, table in enumerate(tables):
+        for seats, chosen in list(best.items()):
+            total = seats + table.max_seats
+            if total not in best or len(best[total]) > len(chosen) + 1:
+                best[total] = chosen + (index,)
+
+    candidates = [(len(chosen), seats, chosen) for seats, chosen in best.items() if seats >= number_of_guests]
+    if not candidates:
+        return None
+    return [tables[index] for index in min(candidates)[2]]
+
+
+def allocate_locked_tables(shop, start_time, end_time, number_of_guests):
+    # Lock every table of the shop (in pk order, so concurrent bookings can't deadlock) before looking for free ones,
+    # a booking of the same slot that commits meanwhile is then visible to the query below. Needs a transaction.
+    list(Table.objects.select_for_update().filter(shop=shop).order_by('pk').values_list('pk', flat=True))
+    return allocate_tables(get_available_tables(shop, start_time, end_time), number_of_guests)
+
+
+def get_availability(shop, date):
+    key = 'users:availability:{}:{}:{}'.format(get_availability_cache_version(date), shop.pk, date.isoformat())
+    slots = cache.get(key)
+    if slots is None:
+        slots = _compute_availability(shop, date)
+        cache.set(key, slots, AVAILABILITY_CACHE_TIMEOUT)
+    return slots
+
+
+def _compute_availability(shop, date):
+    opening = make_aware(datetime.combine(date, shop.start_time))
+    closing = make_aware(datetime.combine(date, shop.close_time))
+    step = timedelta(minutes=AVAILABILITY_SLOT_MINUTES)
+    starts = []
+    while opening + step * len(starts) < closing:
+        starts.append(opening + step * len(starts))
+
+    seats = dict(Table.objects.filter(shop=shop).values_list('pk', 'max_seats'))
+    busy = [set() for _ in starts]
+    booked_tables = Booking.tables.through.objects.filter(
+        table__shop=shop, booking__start_time__lt=closing, booking__end_time__gt=opening
+    ).values_list('table', 'booking__start_time', 'booking__end_time')
+    for table, start_time, end_time in booked_tables:
+        first = max(int((start_time - opening) / step), 0)
+        for index in range(first, len(starts)):
+            if starts[index] >= end_time:
+                break
+            busy[index].add(table)
+
+    return [{
+        'start': start.strftime('%H:%M'),
+        'end': min(start + step, closing).strftime('%H:%M'),
+        'free_tables': len(seats) - len(busy[index]),
+        'free_seats': sum(max_seats for table, max_seats in seats.items() if table not in busy[index]),
+    } for index, start in enumerate(starts)]
+
+
+def get_schedule_conflicts(user, week_day, start_time, end_time, exclude=None):
+    schedules = Schedule.objects.filter(user=user, week_day=week_day, start_time__lt=end_time, end_time__gt=start_time)
+    if exclude is not None:
+        schedules = schedules.exclude(pk=exclude)
+    return schedules
+
+
+def _parse_roster_time(value):
+    try:
+        return parse_time((value or '').strip())
+    except ValueError:
+        return None
+
+
+def read_roster(rows, approve_date=None):
+    rows = list(rows)
+    users = dict(User.objects.filter(
+        employee__isnull=False, username__in={row.get('username') for row in rows}
+    ).values_list('username', 'pk'))
+    shops = dict(Shop.objects.filter(name__in={row.get('shop') for row in rows}).values_list('name', 'pk'))
+    week_days = dict(Schedule.DAYS_OF_WEEK)
+
+    schedules, errors = [], []
+    for line, row in enumerate(rows, start=2):
+        user, shop = users.get(row.get('username')), shops.get(row.get('shop'))
+        week_day = (row.get('week_day') or '').strip().lower()
+        start_time, end_time = _parse_roster_time(row.get('start_time')), _parse_roster_time(row.get('end_time'))
+        if user is None:
+            errors.append('Line {}: unknown employee "{}"'.format(line, row.get('username')))
+        elif shop is None:
+            errors.append('Line {}: unknown coffeehouse "{}"'.format(line, row.get('shop')))
+        elif week_day not in week_days:
+            errors.append('Line {}: unknown day of week "{}"'.format(line, row.get('week_day')))
+        elif start_time is None or end_time is None or start_time >= end_time:
+            errors.append('Line {}: invalid shift time'.format(line))
+        else:
+            schedules.append((line, Schedule(
+                user_id=user, shop_id=shop, week_day=week_day, start_time=start_time, end_time=end_time,
+                approve_date=approve_date
+            )))
+    if errors:
+        return [], errors
+
+    shifts = {}
+    existing = Schedule.objects.filter(
+        user__in={schedule.user_id for _, schedule in schedules},
+        week_day__in={schedule.week_day for _, schedule in schedules}
+    ).values_list('user', 'week_day', 'start_time', 'end_time')
+    for user, week_day, start_time, end_time in existing:
+        shifts.setdefault((user, week_day), []).append((start_time, end_time, None))
+    for line, schedule in schedules:
+        shifts.setdefault((schedule.user_id, schedule.week_day), []).append(
+            (schedule.start_time, schedule.end_time, line)
+        )
+
+    conflicts = set()
+    for day_shifts in shifts.values():
+        latest_end, latest_line = None, None
+        for start_time, end_time, line in sorted(day_shifts, key=lambda shift: shift[:2]):
+            if latest_end is not None and start_time < latest_end:
+                conflicts.add(line if line is not None else latest_line)
+            if latest_end is None or end_time > latest_end:
+                latest_end, latest_line = end_time, line
+    conflicts.discard(None)
+    if conflicts:
+        return [], ['Line {}: schedule conflict'.format(line) for line in sorted(conflicts)]
+    return [schedule for _, schedule in schedules], []
@@ -1,3 +1,290 @@
-from django.test import TestCase
+import random
+import re
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cafe.models import Table
+from cafe.tests import CafeFixturesMixin
+from users.models import Booking, Schedule
+from users.services import allocate_tables, get_available_tables, read_roster
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class UsersViewsQueriesTest(CafeFixturesMixin, TestCase):
+    def test_anonymous_pages(self):
+        self.assertPageQueries(None, reverse('users:index'), 0)
+        self.assertPageQueries(None, reverse('users:register'), 0)
+        self.assertPageQueries(None, reverse('users:login'), 0)
+
+    def test_bookings(self):
+        self.assertPageQueries(self.client_user, reverse('users:bookings'), 6)
+
+    def test_availability(self):
+        url = reverse('users:availability', kwargs={'pk': self.shops[0].pk})
+        day = (date.today() + timedelta(days=1)).isoformat()
+        self.assertPageQueries(None, url, 3, data={'date': day})
+        self.assertPageQueries(None, url, 1, data={'date': day})
+
+    def test_add_booking(self):
+        data = {
+            'shop': self.shops[1].pk, 'number_of_guests': 7,
+            'date': (date.today() + timedelta(days=40)).strftime('%m/%d/%Y'), 'start_time': '10:00', 'end_time': '12:00'
+        }
+        self.assertPageQueries(self.client_user, reverse('users:add-booking'), 12, status_code=302, data=data, method='post')
+
+    def test_add_booking_without_guests(self):
+        data = {
+            'shop': self.shops[1].pk, 'number_of_guests': 0,
+            'date': (date.today() + timedelta(days=40)).strftime('%m/%d/%Y'), 'start_time': '10:00', 'end_time': '12:00'
+        }
+        self.client.force_login(self.client_user)
+        response = self.client.post(reverse('users:add-booking'), data, follow=True)
+        self.assertRedirects(response, reverse('users:bookings'))
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Ensure this value is greater than or equal to 1.']
+        )
+        self.assertFalse(Booking.objects.filter(start_time__date=date.today() + timedelta(days=40)).exists())
+
+    def test_add_booking_with_missing_fields(self):
+        valid = {
+            'shop': self.shops[1].pk, 'number_of_guests': 2,
+            'date': (date.today() + timedelta(days=40)).strftime('%m/%d/%Y'), 'start_time': '10:00', 'end_time': '12:00'
+        }
+        cases = [
+            ({'date': ''}, 'This field is required.'),
+            ({'date': '02/30/2030'}, 'Enter a valid date.'),
+            ({'start_time': ''}, 'This field is required.'),
+            ({'end_time': '25:00'}, 'Enter a valid time.'),
+            ({'shop': ''}, 'This field is required.'),
+            ({'shop': 999}, 'Select a valid choice. That choice is not one of the available choices.'),
+        ]
+        self.client.force_login(self.client_user)
+        bookings = Booking.objects.count()
+        for changes, message in cases:
+            response = self.client.post(reverse('users:add-booking'), dict(valid, **changes), follow=True)
+            self.assertRedirects(response, reverse('users:bookings'))
+            self.assertEqual([str(message) for message in response.context['messages']], [message])
+        self.assertEqual(Booking.objects.count(), bookings)
+
+    def test_add_booking_rechecks_locked_tables(self):
+        day = date.today() + timedelta(days=40)
+        start_time = timezone.make_aware(datetime.combine(day, time(10)))
+        booking = Booking.objects.create(user=self.admin, start_time=start_time, end_time=start_time + timedelta(hours=2))
+        booking.tables.set(Table.objects.filter(shop=self.shops[1]))
+        self.client.force_login(self.client_user)
+        # Validation passed before another booking took every table.
+        with mock.patch('users.forms.allocate_tables', return_value=[Table()]):
+            response = self.client.post(reverse('users:add-booking'), {
+                'shop': self.shops[1].pk, 'number_of_guests': 2, 'date': day.strftime('%m/%d/%Y'), 'start_time': '10:00',
+                'end_time': '12:00'
+            }, follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['No tables available in this coffeehouse for given date']
+        )
+        self.assertEqual(list(Booking.objects.filter(start_time=start_time)), [booking])
+
+    def test_schedules(self):
+        self.assertPageQueries(self.barist, reverse('users:schedules'), 6)
+        self.assertPageQueries(self.admin, reverse('users:schedules'), 7)
+
+    def test_add_schedules(self):
+        data = {'shop': self.shops[0].pk, 'week_day': 'sunday', 'start_time': '20:00', 'end_time': '22:00'}
+        self.assertPageQueries(self.barist, reverse('users:add-schedules'), 6, status_code=302, data=data, method='post')
+        data.update(user=self.barist.pk, start_time='06:00', end_time='07:00')
+        self.assertPageQueries(self.admin, reverse('users:add-manager-schedules'), 8, status_code=302, data=data, method='post')
+
+    def test_add_schedule_conflicts(self):
+        Schedule.objects.filter(user=self.barist).delete()
+        Schedule.objects.create(
+            user=self.barist, shop=self.shops[0], week_day='monday', start_time=time(10), end_time=time(14)
+        )
+        shifts = [
+            (self.barist, 'users:add-schedules', 'monday', '09:00', '15:00', 'Employee is busy then'),
+            (self.barist, 'users:add-schedules', 'monday', '14:00', '16:00', 'Schedule successfully created'),
+            (self.barist, 'users:add-schedules', 'tuesday', '10:00', '14:00', 'Schedule successfully created'),
+            (self.barist, 'users:add-schedules', 'friday', '14:00', '10:00', 'Start time has to be earlier than end time'),
+            (self.admin, 'users:add-manager-schedules', 'monday', '11:00', '12:00', 'Employee is busy then'),
+            (self.admin, 'users:add-manager-schedules', 'monday', '08:00', '10:00', 'Schedule successfully created'),
+            (self.admin, 'users:add-manager-schedules', 'friday', '14:00', '10:00', 'Start time has to be earlier than end time'),
+        ]
+        for user, name, week_day, start_time, end_time, message in shifts:
+            self.client.force_login(user)
+            response = self.client.post(reverse(name), {
+                'user': self.barist.pk, 'shop': self.shops[0].pk, 'week_day': week_day, 'start_time': start_time,
+                'end_time': end_time
+            }, follow=True)
+            self.assertEqual([str(message) for message in response.context['messages']], [message])
+        self.assertEqual(
+            list(Schedule.objects.filter(user=self.barist).order_by('week_day', 'start_time').values_list(
+                'week_day', 'start_time', 'end_time'
+            )),
+            [('monday', time(8), time(10)), ('monday', time(10), time(14)), ('monday', time(14), time(16)),
+             ('tuesday', time(10), time(14))]
+        )
+
+    def test_update_schedules(self):
+        pending = list(Schedule.objects.filter(approve_date__isnull=True).values_list('pk', flat=True))
+        url = reverse('users:update-schedules', kwargs={'pk': pending[0]})
+        self.assertPageQueries(self.admin, url, 4, status_code=302, data={'change': 'Accept'}, method='post')
+        self.assertPageQueries(
+            self.admin, reverse('users:bulk-update-schedules'), 3, status_code=302,
+            data={'schedules': pending[1:], 'change': 'Accept selected'}, method='post'
+        )
+        self.assertFalse(Schedule.objects.filter(approve_date__isnull=True).exists())
+
+    def test_import_schedules(self):
+        roster = 'username,shop,week_day,start_time,end_time\n' + ''.join(
+            '{},{},sunday,20:00,22:00\n'.format(user.username, self.shops[index % 3].name)
+            for index, user in enumerate(self.employees)
+        )
+        self.assertPageQueries(
+            self.admin, reverse('users:import-schedules'), 6, status_code=302,
+            data={'roster': SimpleUploadedFile('roster.csv', roster.encode())}, method='post'
+        )
+
+    def test_salaries(self):
+        self.assertPageQueries(self.barist, reverse('users:salaries'), 4)
+        self.assertPageQueries(self.admin, reverse('users:salaries'), 4)
+        data = {'user': self.barist.pk, 'amount': '3000.00', 'date': date.today().strftime('%m/%d/%Y')}
+        self.assertPageQueries(self.admin, reverse('users:add-salary'), 5, status_code=302, data=data, method='post')
+
+    def test_supplies(self):
+        self.assertPageQueries(self.admin, reverse('users:supplies'), 6)
+
+    def test_reports(self):
+        self.assertPageQueries(self.admin, reverse('users:reports'), 2)
+        for name in ('users:order-report', 'users:employee-order-report', 'users:ingredient-report'):
+            self.assertPageQueries(self.admin, reverse(name), 5)
+            self.assertPageQueries(self.admin, reverse(name), 6, data={'shop': self.shops[0].pk})
+            self.assertPageQueries(self.admin, reverse(name), 4, data={'export': 'csv'})
+            self.assertPageQueries(self.admin, reverse(name), 4, data={'export': 'json'})
+
+    def test_employee_report_rows_leave_out_passwords(self):
+        response = self.assertPageQueries(self.admin, reverse('users:employee-order-report'), 5)
+        self.assertTrue(response.context['user_list'])
+        for user in response.context['user_list']:
+            self.assertNotIn('password', user.__dict__)
+
+    def test_reports_with_invalid_range(self):
+        self.client.force_login(self.admin)
+        data = {'start_date': '05/02/2020', 'end_date': '05/01/2020'}
+        for name, context_name in (('users:order-report', 'product_list'), ('users:ingredient-report', 'ingredient_list')):
+            for export in ('', 'csv'):
+                response = self.client.get(reverse(name), dict(data, export=export))
+                self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+                self.assertEqual(list(response.context[context_name]), [])
+                self.assertEqual(
+                    [str(message) for message in response.context['messages']],
+                    ['Start date can\'t be later than end date']
+                )
+        response = self.client.get(reverse('users:order-report'), {'start_date': '13/45/2020'})
+        self.assertEqual([str(message) for message in response.context['messages']], ['Enter a valid date.'])
+
+    def test_report_export_queries_logged(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('elka_coffee.requests', 'DEBUG') as logs:
+            response = self.client.get(reverse('users:order-report'), {'export': 'csv'})
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertEqual([record.queries for record in logs.records], [queries + 2])
+
+    def test_reports_do_not_grow_with_orders(self):
+        self.client.force_login(self.admin)
+        names = ('users:order-report', 'users:employee-order-report', 'users:ingredient-report')
+        before = []
+        for name in names:
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse(name), {'start_date': datetime.today().strftime('%m/%d/%Y')})
+            before.append(len(context))
+        self.create_orders(100, random.Random(2))
+        for name, number in zip(names, before):
+            cache.clear()
+            self.assertPageQueries(None, reverse(name), number, data={'start_date': datetime.today().strftime('%m/%d/%Y')})
+
+    def test_sessions_from_model_backend_stay_logged_in(self):
+        self.client.force_login(self.client_user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('users:bookings')).status_code, 200)
+
+    def test_logout(self):
+        self.assertPageQueries(self.barist, reverse('users:logout'), 4, status_code=302)
+
+
+class UsersServicesTest(CafeFixturesMixin, TestCase):
+    def test_allocate_tables(self):
+        cases = [([2, 4, 6, 3], 7, [4, 3]), ([2], 3, None), ([4, 4, 8], 8, [8]), ([2, 2], 4, [2, 2]), ([], 1, None)]
+        for seats, number_of_guests, expected in cases:
+            tables = [Table(number=number, max_seats=max_seats) for number, max_seats in enumerate(seats)]
+            allocated = allocate_tables(tables, number_of_guests)
+            self.assertEqual(None if allocated is None else [table.max_seats for table in allocated], expected)
+
+    def test_get_available_tables(self):
+        shop = self.shops[0]
+        first, second, third = Table.objects.filter(shop=shop).order_by('number')[:3]
+        start_time = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(days=100)
+        end_time = start_time + timedelta(hours=2)
+        bookings = [
+            (first, start_time - timedelta(hours=1), end_time + timedelta(hours=1)),
+            (second, start_time - timedelta(hours=1), start_time),
+            (second, end_time, end_time + timedelta(hours=1)),
+            (third, start_time + timedelta(minutes=30), start_time + timedelta(hours=1)),
+        ]
+        for table, booking_start, booking_end in bookings:
+            booking = Booking.objects.create(user=self.client_user, start_time=booking_start, end_time=booking_end)
+            booking.tables.add(table)
+        self.assertEqual(
+            get_available_tables(shop, start_time, end_time),
+            list(Table.objects.filter(shop=shop).exclude(pk__in=[first.pk, third.pk]).order_by('number'))
+        )
+
+    def test_read_roster(self):
+        Schedule.objects.filter(user__in=[self.barist, self.admin]).delete()
+        Schedule.objects.create(
+            user=self.barist, shop=self.shops[0], week_day='monday', start_time=time(16), end_time=time(18)
+        )
+        shop = self.shops[1].name
+
+        def row(week_day, start_time, end_time, username='barist'):
+            return {'username': username, 'shop': shop, 'week_day': week_day, 'start_time': start_time,
+                    'end_time': end_time}
+
+        schedules, errors = read_roster([
+            row('monday', '08:00', '12:00'), row('monday', '12:00', '16:00'), row('monday', '18:00', '20:00'),
+            row('Tuesday', '08:00', '10:00'), row('tuesday', '14:00', '18:00'), row('tuesday', '10:00', '14:00', 'admin'),
+        ], approve_date=date.today())
+        self.assertEqual(errors, [])
+        self.assertEqual([
+            (schedule.user_id, schedule.shop_id, schedule.week_day, schedule.start_time, schedule.end_time,
+             schedule.approve_date) for schedule in schedules
+        ], [
+            (self.barist.pk, self.shops[1].pk, 'monday', time(8), time(12), date.today()),
+            (self.barist.pk, self.shops[1].pk, 'monday', time(12), time(16), date.today()),
+            (self.barist.pk, self.shops[1].pk, 'monday', time(18), time(20), date.today()),
+            (self.barist.pk, self.shops[1].pk, 'tuesday', time(8), time(10), date.today()),
+            (self.barist.pk, self.shops[1].pk, 'tuesday', time(14), time(18), date.today()),
+            (self.admin.pk, self.shops[1].pk, 'tuesday', time(10), time(14), date.today()),
+        ])
+
+        schedules, errors = read_roster([
+            row('monday', '08:00', '12:00'), row('monday', '09:00', '10:00'), row('monday', '17:00', '19:00'),
+            row('wednesday', '08:00', '16:00'), row('wednesday', '10:00', '18:00'), row('friday', '10:00', '08:00'),
+        ])
+        self.assertEqual(schedules, [])
+        self.assertEqual(errors, ['Line 7: invalid shift time'])
+        schedules, errors = read_roster([
+            row('monday', '08:00', '12:00'), row('monday', '09:00', '10:00'), row('monday', '17:00', '19:00'),
+            row('wednesday', '08:00', '16:00'), row('wednesday', '10:00', '18:00'),
+        ])
+        self.assertEqual(schedules, [])
+        self.assertEqual(errors, ['Line 3: schedule conflict', 'Line 4: schedule conflict', 'Line 6: schedule conflict'])
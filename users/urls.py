@@ -5,7 +5,8 @@ from django.urls import path
 from cafe.views import SupplyListView, SalaryListView, AddSalaryView, ProductOrderReportView, ReportsView, \
     EmployeeOrderReportView, IngredientUsageReportView
 from users.views import RegisterView, IndexView, LoginView, BookingListView, CreateBookingView, ScheduleListView, \
-    AddScheduleView, UpdateScheduleView, AddScheduleManagerView
+    AddScheduleView, UpdateScheduleView, AddScheduleManagerView, AvailabilityView, BulkUpdateScheduleView, \
+    ImportScheduleView
 
 app_name = 'users'
 urlpatterns = [
@@ -16,7 +17,10 @@ urlpatterns = [
     path('add-schedules', AddScheduleView.as_view(), name="add-schedules"),
     path('add-manager-schedules', AddScheduleManagerView.as_view(), name="add-manager-schedules"),
     path('update-schedules/<int:pk>', UpdateScheduleView.as_view(), name="update-schedules"),
+    path('update-schedules', BulkUpdateScheduleView.as_view(), name="bulk-update-schedules"),
+    path('import-schedules', ImportScheduleView.as_view(), name="import-schedules"),
     path('add-reservations', CreateBookingView.as_view(), name="add-booking"),
+    path('availability/<int:pk>', AvailabilityView.as_view(), name="availability"),
     path('supplies', SupplyListView.as_view(), name="supplies"),
     path('salary', SalaryListView.as_view(), name="salaries"),
     path('add-salary', AddSalaryView.as_view(), name="add-salary"),
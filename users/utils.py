@@ -1,8 +1,6 @@
 from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin
 from django.http import Http404
 
-from users.models import Employee
-
 
 class AnonymousRequiredMixin(AccessMixin):
     def dispatch(self, request, *args, **kwargs):
@@ -13,20 +11,20 @@ class AnonymousRequiredMixin(AccessMixin):
 
 class EmployeeRequiredMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_anonymous or not hasattr(request.user, 'employee'):
+        if request.user.is_anonymous or not request.user.is_employee:
             return self.handle_no_permission()
         return super().dispatch(request, *args, **kwargs)
 
 
 class ClientRequiredMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_anonymous or not hasattr(request.user, 'client'):
+        if request.user.is_anonymous or not request.user.is_client:
             return self.handle_no_permission()
         return super().dispatch(request, *args, **kwargs)
 
 
 class AdminRequiredMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_anonymous or not hasattr(request.user, 'employee') or not request.user.employee.job_title == Employee.ADMIN:
+        if request.user.is_anonymous or not request.user.is_admin:
             return self.handle_no_permission()
         return super().dispatch(request, *args, **kwargs)
@@ -4,16 +4,19 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
-from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
-from django.views.generic import FormView, TemplateView, ListView
+from django.views.generic import FormView, TemplateView, ListView, View
 
 from cafe.filters import ScheduleFilter
-from cafe.models import Table
-from users.forms import RegisterForm, BookingForm, AddScheduleForm, AddAdminScheduleForm
-from users.models import Client, Booking, Schedule, Employee
+from cafe.models import Shop, Table
+from users.forms import RegisterForm, BookingForm, AddScheduleForm, AddAdminScheduleForm, AvailabilityForm, \
+    ScheduleRosterForm
+from users.models import Client, Booking, Schedule
+from users.services import get_availability, allocate_locked_tables, NO_TABLES_MESSAGE
 from users.utils import AnonymousRequiredMixin, EmployeeRequiredMixin, AdminRequiredMixin
 
 User = get_user_model()
@@ -43,7 +46,9 @@ class BookingListView(LoginRequiredMixin, ListView):
     template_name = 'users/bookings.html'
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('tables', queryset=Table.objects.select_related('shop'))
+        )
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
@@ -57,37 +62,51 @@ class CreateBookingView(LoginRequiredMixin, FormView):
     form_class = BookingForm
 
     def form_valid(self, form):
-        booking = Booking.objects.create(
-            user=self.request.user, end_time=form.cleaned_data.get('end_time'),
-            start_time=form.cleaned_data.get('start_time')
-        )
-        number_of_guests = form.cleaned_data.get('number_of_guests')
-        shop_tables = Table.objects.filter(shop=form.cleaned_data.get('shop')).exclude(
-            bookings__start_time__range=[form.cleaned_data.get('start_time'), form.cleaned_data.get('end_time')],
-            bookings__end_time__range=[form.cleaned_data.get('start_time'), form.cleaned_data.get('end_time')],
-        )
-        booking.tables.set(shop_tables[:2])
+        start_time, end_time = form.cleaned_data.get('start_time'), form.cleaned_data.get('end_time')
+        with transaction.atomic():
+            # The form picked the tables without a lock, another booking may have taken them since.
+            tables = allocate_locked_tables(
+                form.cleaned_data.get('shop'), start_time, end_time, form.cleaned_data.get('number_of_guests')
+            )
+            if not tables:
+                form.add_error(None, NO_TABLES_MESSAGE)
+                return self.form_invalid(form)
+            booking = Booking.objects.create(user=self.request.user, end_time=end_time, start_time=start_time)
+            booking.tables.set(tables)
         messages.success(request=self.request, message='Reservation successfully created', extra_tags='success')
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        for error in form.errors['__all__'].data[0].messages:
-            messages.error(request=self.request, message=error, extra_tags='error')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
         return HttpResponseRedirect(self.get_success_url())
 
 
+class AvailabilityView(View):
+    def get(self, request, *args, **kwargs):
+        shop = get_object_or_404(Shop, pk=kwargs.get('pk'))
+        form = AvailabilityForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        date = form.cleaned_data['date']
+        return JsonResponse({'shop': shop.pk, 'date': date.isoformat(), 'slots': get_availability(shop, date)})
+
+
 class ScheduleListView(EmployeeRequiredMixin, ListView):
     template_name = 'users/schedules.html'
 
     def get_queryset(self):
-        return ScheduleFilter(self.request.GET, queryset=Schedule.objects.filter(
+        queryset = Schedule.objects.select_related('shop', 'user')
+        return ScheduleFilter(self.request.GET, queryset=queryset.filter(
             user=self.request.user, approve_date__isnull=False))\
-            if self.request.user.employee.job_title != Employee.ADMIN else ScheduleFilter(
-            self.request.GET, queryset=Schedule.objects.all())
+            if not self.request.user.is_admin else ScheduleFilter(
+            self.request.GET, queryset=queryset)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
-        context.update({'form': AddAdminScheduleForm if self.request.user.employee.job_title == Employee.ADMIN else AddScheduleForm})
+        context.update({'form': AddAdminScheduleForm if self.request.user.is_admin else AddScheduleForm,
+                        'roster_form': ScheduleRosterForm})
         return context
 
 
@@ -96,18 +115,20 @@ class AddScheduleView(EmployeeRequiredMixin, FormView):
     success_url = reverse_lazy('users:schedules')
     form_class = AddScheduleForm
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update(instance=Schedule(user=self.request.user))
+        return kwargs
+
     def form_valid(self, form):
-        schedules = Schedule.objects.filter(user=self.request.user).filter(Q(start_time__range=[form.cleaned_data['start_time'], form.cleaned_data['end_time']]) | Q(end_time__range=[form.cleaned_data['start_time'], form.cleaned_data['end_time']]))
-        if schedules:
-            messages.error(request=self.request, message='Schedule conflict!', extra_tags='error')
-            return HttpResponseRedirect(self.get_success_url())
-        Schedule.objects.create(user=self.request.user, **form.cleaned_data)
+        form.save()
         messages.success(request=self.request, message='Schedule successfully created', extra_tags='success')
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        for error in form.errors['__all__'].data[0].messages:
-            messages.error(request=self.request, message=error, extra_tags='error')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -127,21 +148,53 @@ class UpdateScheduleView(EmployeeRequiredMixin, FormView):
         return HttpResponseRedirect(self.success_url)
 
 
+class BulkUpdateScheduleView(AdminRequiredMixin, FormView):
+    http_method_names = ['post']
+    success_url = reverse_lazy('users:schedules')
+
+    def post(self, request, *args, **kwargs):
+        schedules = Schedule.objects.filter(pk__in=[pk for pk in request.POST.getlist('schedules') if pk.isdigit()])
+        if request.POST.get('change') == 'Cancel':
+            count, _ = schedules.delete()
+            messages.success(request=self.request, message='{} schedules deleted'.format(count), extra_tags='success')
+        else:
+            count = schedules.filter(approve_date__isnull=True).update(approve_date=datetime.today().date())
+            messages.success(request=self.request, message='{} schedules accepted'.format(count), extra_tags='success')
+        return HttpResponseRedirect(self.success_url)
+
+
+class ImportScheduleView(AdminRequiredMixin, FormView):
+    http_method_names = ['post']
+    success_url = reverse_lazy('users:schedules')
+    form_class = ScheduleRosterForm
+
+    def form_valid(self, form):
+        Schedule.objects.bulk_create(form.schedules, batch_size=500)
+        messages.success(
+            request=self.request, message='{} schedules imported'.format(len(form.schedules)), extra_tags='success'
+        )
+        return super().form_valid(form)
+
+    def form_invalid(self, form):
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
+        return HttpResponseRedirect(self.get_success_url())
+
+
 class AddScheduleManagerView(AdminRequiredMixin, FormView):
     http_method_names = ['post']
     success_url = reverse_lazy('users:schedules')
     form_class = AddAdminScheduleForm
 
     def form_valid(self, form):
-        schedules = Schedule.objects.filter(user=form.cleaned_data.get('user')).filter(Q(start_time__range=[form.cleaned_data['start_time'], form.cleaned_data['end_time']]) | Q(end_time__range=[form.cleaned_data['start_time'], form.cleaned_data['end_time']]))
-        if schedules:
-            messages.error(request=self.request, message='Employee is busy then', extra_tags='error')
-            return HttpResponseRedirect(self.get_success_url())
-        Schedule.objects.create(**form.cleaned_data, approve_date=datetime.now())
+        form.instance.approve_date = datetime.now()
+        form.save()
         messages.success(request=self.request, message='Schedule successfully created', extra_tags='success')
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        for error in form.errors['__all__'].data[0].messages:
-            messages.error(request=self.request, message=error, extra_tags='error')
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request=self.request, message=error, extra_tags='error')
         return HttpResponseRedirect(self.get_success_url())